@@ -1,473 +1,896 @@
-from ast import Global
 import dash
-from dash import dcc, html, Input, Output, State, dash_table
+from dash import dcc, html, Input, Output, State, dash_table, ClientsideFunction, Patch
 import dash_bootstrap_components as dbc
-import plotly.graph_objects as go
+import plotly.io as pio
 import polars as pl
 from datetime import datetime
-import io
-import base64
-import pandas as pd
-from logic import Leaderboard
 import logic
+import metrics
 from dash.exceptions import PreventUpdate
 from datetime import date
+import os
+import threading
+import uuid
+import sessions
+import transport
+import data
+import palette
+import flask
 
 
-# Initialize Leaderboard instance
-board = logic.Leaderboard()
-# Extract the min and max dates
-min_date, max_date = board.get_date_range()
+# Leaderboard state lives per browser session; the data itself is shared
+session_store = sessions.from_env()
+
+# Live mode: new trading days dropped in this folder are pushed to open dashboards
+LIVE_FEED_DIR = os.environ.get("LEADERBOARD_FEED_DIR")
+LIVE_POLL_SECONDS = float(os.environ.get("LEADERBOARD_FEED_INTERVAL", 5))
+
+# Pan/zoom is recomputed once the chart has been still for this long
+VIEWPORT_DEBOUNCE_MS = int(os.environ.get("LEADERBOARD_VIEWPORT_DEBOUNCE_MS", 250))
+
+def start_live_feed():
+    """
+    Starts the feed watcher of live mode, if enabled; call once in every serving process
+    """
+    if LIVE_FEED_DIR:
+        import live # imported on use, like export and instrument: startup skips them
+        return live.start(data.load(), LIVE_FEED_DIR, LIVE_POLL_SECONDS)
+
+def start_background():
+    """
+    Loads the default dataset in a background thread, then starts live mode if
+    enabled; call once in every serving process. Pages are served meanwhile, and
+    /ready answers 503 until the dataset is loaded.
+    """
+    def start():
+        data.warm()
+        start_live_feed()
+
+    threading.Thread(target=start, name="leaderboard-warm", daemon=True).start()
 
 # Helper Functions
-def create_figure(data, x_col, y_col, title, x_label, y_label, group_col="policy"):
+def chart_series(board):
     """
-    Create a Plotly Figure from given data, with cumulative profit.
+    The daily profit series of every policy, for the browser to draw the chart from
+    (see assets/leaderboard.js), with the excluded regions to shade
+
+    New days are appended as further chunks by live mode.
     """
-    fig = go.Figure()
-    
-    # Define your policy colors
-    policy_colors = {
-        "PJMvirts Captain Hindsight": "#54C158",  # Green
-        "PJMvirts Pricetaker Short": "#FFA800",   # Orange
-        "PJMvirts Pricetaker Long": "#25A5FF"     # Blue
+    return {
+        "exclusions": [[start.isoformat(), end.isoformat()] for start, end in board.exclusions],
+        "chunks": [transport.series_chunk(board.daily_profits(), logic.PROFITS)],
+        "colors": policy_colors(board),
     }
 
-    if data is not None and not data.is_empty():
-        for group in data[group_col].unique():
-            filtered_data = data.filter(pl.col(group_col) == group)
 
-            # Sort data by date
-            filtered_data = filtered_data.sort(x_col)
+def chart_window(board):
+    """
+    The window the chart is clipped to in area mode
+    """
+    return {"start": board.window_start.isoformat(), "end": board.window_end.isoformat()}
+
+
+def parse_axis_date(value):
+    """
+    A datetime from a plotly axis bound: "YYYY-MM-DD", optionally followed by a time
+    with any number of fractional digits
+    """
+    return datetime.fromisoformat(str(value).replace(" ", "T")[:19])
+
+
+def rank_series(board):
+    """
+    The rank history of the board's table rows, one typed-array series per row, for
+    the browser to draw the rank chart from
+    """
+    history = board.rank_history()
+    name = pl.col("policy").cast(pl.Utf8)
+    if "node" in history.columns:
+        name = pl.concat_str([name, pl.col("node").cast(pl.Utf8)], separator=" / ")
+    history = history.with_columns(name.alias("name")).sort(["name", "date"])
+    return {
+        "metric": board.metric,
+        "chunks": [transport.series_chunk(history, ["rank"], name="name")],
+        "colors": policy_colors(board),
+    }
+
+
+def wins_losses_data(board):
+    """
+    Win/loss counts per policy and the histogram of daily PnL, column-wise for the
+    browser to draw the Wins vs Losses tab from
+    """
+    return {
+        "counts": transport.table_columns(board.outcome_counts()),
+        "histogram": transport.table_columns(board.pnl_histogram()),
+        "colors": policy_colors(board),
+    }
 
-            # Calculate cumulative profit
-            filtered_data = filtered_data.with_columns(
-                pl.col(y_col).cum_sum().alias("cumulative_profit")
-            )
-            
-            # Get the color for the current group, default to gray if not found
-            line_color = policy_colors.get(group, "#A0A0A0")  # Default color if not found
-            
-            # Add trace for each policy with specific color
-            fig.add_trace(go.Scatter(
-                x=filtered_data[x_col].to_list(),
-                y=filtered_data["cumulative_profit"].to_list(),
-                mode="lines",
-                name=group,
-                line=dict(color=line_color)  # Set the line color
-            ))
 
-    # Update layout with titles and such
-    fig.update_layout(title=title, xaxis_title=x_label, yaxis_title=y_label)
-    return fig
+def policy_colors(board):
+    """
+    The color of each policy of the board's dataset, for the charts and the table
+    """
+    return palette.policy_colors(board.dataset.policies())
+
+
+def date_controls(board):
+    """
+    The date picker's range and the what-if years, for the board's dataset
+    """
+    start, end = board.get_date_range()
+    years = [{"label": str(year), "value": year} for year in range(start.year, end.year + 1)]
+    return start.isoformat(), end.isoformat(), years, start.year
+
+
+# headers of the metric table's columns; the risk metrics are only shown on demand
+TABLE_COLUMNS = {
+    "policy": "Model Name",
+    "PnL": "Total Profit",
+    "per MWh": "Profit per MWh",
+    "win %": "Win Percentage",
+    "Sharpe": "Sharpe",
+    "Sortino": "Sortino",
+    "max drawdown": "Max Drawdown",
+    "drawdown days": "Drawdown Days",
+    "profit factor": "Profit Factor",
+    "30d PnL": "30-Day PnL",
+    "90d PnL": "90-Day PnL",
+}
+
+
+def table_columns(metric, risk):
+    """
+    The metric table's columns: the risk metrics when shown or ranked on (see
+    Leaderboard.summarize), always the others
+    """
+    shown = risk or metric in metrics.RISK
+    return [{"name": name, "id": column} for column, name in TABLE_COLUMNS.items() if shown or column not in metrics.RISK]
 
 
 def prepare_table_data(data):
     """
-    Convert the Polars DataFrame to a list of dictionaries for Dash DataTable.
+    Convert the Polars DataFrame to the column-wise payload of the table-data store,
+    which the browser turns into the DataTable's rows.
     """
-    return data.to_dicts() if data is not None and not data.is_empty() else []
+    return transport.table_columns(data)
+
+# Callback responses go through plotly's JSON encoder: orjson is several times
+# faster than the standard library and writes numpy arrays without boxing them
+pio.json.config.default_engine = "orjson"
 
 # Dash app setup
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP, "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/5.15.4/css/all.min.css"])
 app.title = "Trading Dashboard Dev"
 
-# Define the colors for each policy (for chart and table)
-policy_colors = {
-    "Captain Hindsight": "#54C158",  # Green
-    "Pricetaker Short": "#FFA800",   # Orange
-    "Pricetaker Long": "#25A5FF"     # Blue
-}
-
-app.layout = html.Div([
-    # Header
-    html.Div(
-        id = "header_title",
-        className="header",
-        style={"backgroundColor": "#4682B4", "color": "#003366", "padding": "10px", "textAlign": "center", "position": "relative"},
-        children=[
-            html.H1("Trading Dashboard Dev", style={"margin": "0", "textAlign": "center", "color": "#003366"}),
-            html.I(className="fas fa-chart-bar", style={"position": "absolute", "right": "20px", "top": "50%", "transform": "translateY(-50%)", "fontSize": "24px", "color": "#003366"})
-        ]
-    ),
+def serve_layout():
+    # date bounds from the dataset's cached stats, so the page renders before the
+    # dataset is loaded; the first callback sets them from the session's board
+    min_date, max_date = data.cached_date_range()
+    years = range(min_date.year, max_date.year + 1) if min_date is not None else []
+
+    # a fresh session id for every page load, so each trader gets their own leaderboard
+    return html.Div([
+        dcc.Store(id="session-id", data=str(uuid.uuid4())),
+        dcc.Store(id="chart-series"),  # daily profits of each policy, drawn clientside
+        dcc.Store(id="chart-window"),  # the window area mode clips the chart to
+        dcc.Store(id="table-data"),  # the metric table, column-wise
+        dcc.Store(id="rank-history"),  # daily ranks of the table's rows, drawn clientside
+        dcc.Store(id="wins-losses"),  # win/loss counts and daily PnL histogram, drawn clientside
+        dcc.Store(id="graph-width"),
+        dcc.Store(id="graph-tail"),  # name and last date of each series
+        dcc.Store(id="live-version"),  # dataset version this page last saw
+        dcc.Store(id="viewport"),  # last settled x range of the chart, numbered
+        dcc.Store(id="viewport-debounce", data=VIEWPORT_DEBOUNCE_MS),
+        dcc.Interval(id="live-interval", interval=int(LIVE_POLL_SECONDS * 1000), disabled=not LIVE_FEED_DIR),
+        # Header
+        html.Div(
+            id = "header_title",
+            className="header",
+            style={"backgroundColor": "#4682B4", "color": "#003366", "padding": "10px", "textAlign": "center", "position": "relative"},
+            children=[
+                html.H1("Trading Dashboard Dev", style={"margin": "0", "textAlign": "center", "color": "#003366"}),
+                html.I(className="fas fa-chart-bar", style={"position": "absolute", "right": "20px", "top": "50%", "transform": "translateY(-50%)", "fontSize": "24px", "color": "#003366"})
+            ]
+        ),
     
-    # Main content container with chart and table
-    html.Div(
-        style={"display": "flex", "flexDirection": "row", "padding": "20px", "flexWrap": "wrap"},
-        children=[
-            # Left column: Chart and Wins vs Losses
-            html.Div(
-                style={"flex": "2", "padding": "10px", "minWidth": "300px"},
-                children=[
-                    dcc.Tabs(
-                        id="tabs",
-                        value="tab-1",
-                        children=[
-                            dcc.Tab(label="Profit Chart", value="tab-1"),
-                            dcc.Tab(label="Wins vs Losses", value="tab-2")
-                        ]
-                    ),
-                    html.Div(
-                        style={"display": "flex", "alignItems": "center", "justifyContent": "center", "marginTop": "20px"},
-                        children=[
-                            dcc.Dropdown(
-                                id="chart-type-dropdown",
-                                options=[
-                                    {"label": "Total", "value": "profit_total"},
-                                    {"label": "Short", "value": "profit_short"},
-                                    {"label": "Long", "value": "profit_long"}
-                                ],
-                                value="profit_total",
-                                clearable=False,
-                                style={"width": "200px"}
+        # Main content container with chart and table
+        html.Div(
+            style={"display": "flex", "flexDirection": "row", "padding": "20px", "flexWrap": "wrap"},
+            children=[
+                # Left column: Chart and Wins vs Losses
+                html.Div(
+                    style={"flex": "2", "padding": "10px", "minWidth": "300px"},
+                    children=[
+                        dcc.Tabs(
+                            id="tabs",
+                            value="tab-1",
+                            children=[
+                                dcc.Tab(label="Profit Chart", value="tab-1"),
+                                dcc.Tab(label="Wins vs Losses", value="tab-2"),
+                                dcc.Tab(label="Rank History", value="tab-3")
+                            ]
+                        ),
+                        # Profit chart tab: chart controls and the chart
+                        html.Div(
+                            id="profit-chart-tab",
+                            children=[
+                                html.Div(
+                                    style={"display": "flex", "alignItems": "center", "justifyContent": "center", "marginTop": "20px"},
+                                    children=[
+                                        dcc.Dropdown(
+                                            id="chart-type-dropdown",
+                                            options=[
+                                                {"label": "Total", "value": "profit_total"},
+                                                {"label": "Short", "value": "profit_short"},
+                                                {"label": "Long", "value": "profit_long"}
+                                            ],
+                                            value="profit_total",
+                                            clearable=False,
+                                            style={"width": "200px"}
+                                        ),
+                                        html.Div([
+                                            dbc.Checklist(
+                                                options=[{"label": "Enable Area", "value": "enable"}],
+                                                value=[],  # Initially unchecked
+                                                id="area-toggle",
+                                                switch=True,
+                                                style={"marginLeft": "10px"},
+                                                inline=True,
+                                            ),
+                                            html.Button(
+                                                "Reset Chart",
+                                                id="reset-chart-toggle-button",
+                                                style={
+                                                    "marginLeft": "10px",
+                                                    "backgroundColor": "#4682B4",
+                                                    "border": "none",
+                                                    "color": "white",
+                                                    "padding": "10px",
+                                                    "borderRadius": "5px",
+                                                    "cursor": "pointer"
+                                                },
+                                                n_clicks=0,
+                                            )
+                                        ], id='toggle-area-container', style={"display":"none"}),
+                                    ]
+                                ),
+                                # Chart container and the content for selected tab
+                                html.Div(
+                                    id="chart-container",
+                                    style={"marginBottom": "20px"},
+                                    children=[
+                                        dcc.Graph(
+                                            id="graph",  # This is the id referenced in the callback
+                                            config={"scrollZoom": True},  # Allow zooming
+                                            style={"height": "500px"},  # Set graph size
+                                        )
+                                    ],
+                                )
+                            ]
+                        ),
+                        # Wins vs Losses tab: win/loss counts and the distribution of daily PnL
+                        html.Div(
+                            id="wins-losses-container",
+                            style={"display": "none"},
+                            children=[
+                                dcc.Graph(id="wins-losses-graph", config={"responsive": True}, style={"height": "350px"}),
+                                dcc.Graph(id="pnl-histogram-graph", config={"responsive": True}, style={"height": "350px"}),
+                            ]
+                        ),
+                        # Rank history tab: each row's rank in the table, day by day
+                        html.Div(
+                            id="rank-history-tab",
+                            style={"display": "none"},
+                            children=[
+                                dcc.Graph(
+                                    id="rank-graph",
+                                    config={"responsive": True},
+                                    style={"height": "500px"},
+                                )
+                            ]
+                        ),
+                        # Footer (Date range filter)
+                        html.Div(
+                            style={"marginTop": "20px", "textAlign": "center"},
+                            children=[
+                                dcc.Checklist(
+                                id="date-range-checklist",
+                                options=[{"label": "Enable Date Range Filter", "value": "date_range_enable"}],
+                                value=[],  # Initially unchecked
+                                style={"display": "inline-block"}
                             ),
-                            html.Div([
-                                dbc.Checklist(
-                                    options=[{"label": "Enable Area", "value": "enable"}],
-                                    value=[],  # Initially unchecked
-                                    id="area-toggle",
-                                    switch=True,
-                                    style={"marginLeft": "10px"},
-                                    inline=True,
+                            html.Div(
+                                id="slider-container",  # Wrapper div to control visibility
+                                style={"display": "none"},  # Initially hidden
+                                children=[
+                                    # Create the RangeSlider with dynamic date range
+                                   dcc.DatePickerRange(
+                                        id="date-picker-range",
+                                        start_date=min_date,  # Set default start date
+                                        end_date=max_date,   # Set default end date
+                                        display_format="YYYY-MM-DD",  # Format of the date display
+                                        style={"margin": "10px", "width": "300px"}
+                                    ),
+                                    html.Button("Exclude Range", id="exclude-button", style={"marginLeft": "10px", "padding": "10px"}),
+                                    html.Button("Include Range", id="include-button", style={"marginLeft": "10px", "padding": "10px"}),
+                                    html.Button("Undo", id="undo-button", style={"marginLeft": "10px", "padding": "10px"}),
+                                    html.Button("Redo", id="redo-button", style={"marginLeft": "10px", "padding": "10px"}),
+                                    html.Button("Reset Excluded Ranges", id="reset-button", style={"marginLeft": "10px", "padding": "10px"})
+                                ]
+                            )]
+                        ),
+                    ]
+                ),
+            
+                # Right column: Dropdown, download button, and Table
+                html.Div(
+                    style={"flex": "1", "padding": "10px", "minWidth": "300px"},
+                    children=[
+                        html.Div(
+                            style={"display": "flex", "alignItems": "center", "marginBottom": "20px"},
+                            children=[
+                                dcc.Dropdown(
+                                    id="download-dropdown",
+                                    options=[
+                                        {"label": "Displayed Data", "value": "window_data"},
+                                        {"label": "Exclusions Data", "value": "exclusion_data"},
+                                        {"label": "Original Data", "value": "original_data"}
+                                    ],
+                                    value="window_data",
+                                    placeholder="Select a model",
+                                    style={"flex": "1"}
+                                ),
+                                dcc.Dropdown(
+                                    id="download-format",
+                                    options=[
+                                        {"label": "CSV", "value": "csv"},
+                                        {"label": "Parquet", "value": "parquet"},
+                                        {"label": "Arrow IPC", "value": "arrow"}
+                                    ],
+                                    value="csv",
+                                    clearable=False,
+                                    style={"width": "120px", "marginLeft": "10px"}
                                 ),
-                                html.Button(
-                                    "Reset Chart",
-                                    id="reset-chart-toggle-button",
-                                    style={
-                                        "marginLeft": "10px",
-                                        "backgroundColor": "#4682B4",
-                                        "border": "none",
-                                        "color": "white",
-                                        "padding": "10px",
-                                        "borderRadius": "5px",
-                                        "cursor": "pointer"
-                                    },
-                                    n_clicks=0,
+                                dcc.Checklist(
+                                    id="download-gzip",
+                                    options=[{"label": "gzip", "value": "gzip"}],
+                                    value=[],
+                                    style={"marginLeft": "10px"}
+                                ),
+                                # The export streams from the server's /export route
+                                html.A(
+                                    html.Button(
+                                        html.I(className="fas fa-download", style={"fontSize": "24px", "color": "white"}),
+                                        n_clicks=0,
+                                        id="download-button",
+                                        style={
+                                            "marginLeft": "10px",
+                                            "backgroundColor": "#4682B4",
+                                            "border": "none",
+                                            "color": "white",
+                                            "padding": "10px",
+                                            "borderRadius": "5px",
+                                            "cursor": "pointer",
+                                            "fontSize": "20px"
+
+                                        }
+                                    ),
+                                    id="download-link",
                                 )
-                            ], id='toggle-area-container', style={"display":"none"}),
-                        ]
-                    ),
-                    # Chart container and the content for selected tab
-                    html.Div(
-                        id="chart-container",
-                        style={"marginBottom": "20px"},
-                        children=[
-                            dcc.Graph(
-                                id="graph",  # This is the id referenced in the callback
-                                config={"scrollZoom": True},  # Allow zooming
-                                style={"height": "500px"},  # Set graph size
-                            )
-                        ],
-                    ),
-                    # Footer (Date range filter)
-                    html.Div(
-                        style={"marginTop": "20px", "textAlign": "center"},
-                        children=[
-                            dcc.Checklist(
-                            id="date-range-checklist",
-                            options=[{"label": "Enable Date Range Filter", "value": "date_range_enable"}],
-                            value=[],  # Initially unchecked
-                            style={"display": "inline-block"}
+                            ]
                         ),
                         html.Div(
-                            id="slider-container",  # Wrapper div to control visibility
-                            style={"display": "none"},  # Initially hidden
+                            style={"display": "flex", "alignItems": "center", "marginBottom": "10px"},
                             children=[
-                                # Create the RangeSlider with dynamic date range
-                               dcc.DatePickerRange(
-                                    id="date-picker-range",
-                                    start_date=min_date,  # Set default start date
-                                    end_date=max_date,   # Set default end date
-                                    display_format="YYYY-MM-DD",  # Format of the date display
-                                    style={"margin": "10px", "width": "300px"}
+                                html.Label("Dataset", style={"marginRight": "10px"}),
+                                dcc.Dropdown(
+                                    id="dataset-dropdown",
+                                    options=[{"label": label, "value": source} for label, source in data.registry().items()],
+                                    value=data.DEFAULT_SOURCE,
+                                    clearable=False,
+                                    style={"flex": "1"}
                                 ),
-                                html.Button("Exclude Range", id="exclude-button", style={"marginLeft": "10px", "padding": "10px"}),
-                                html.Button("Reset Excluded Ranges", id="reset-button", style={"marginLeft": "10px", "padding": "10px"})
                             ]
-                        )]
-                    ),
-                    html.Div(
-                        id="wins-losses-container"
-                    ),
-                ]
-            ),
-            
-            # Right column: Dropdown, download button, and Table
-            html.Div(
-                style={"flex": "1", "padding": "10px", "minWidth": "300px"},
-                children=[
-                    html.Div(
-                        style={"display": "flex", "alignItems": "center", "marginBottom": "20px"},
-                        children=[
-                            dcc.Dropdown(
-                                id="download-dropdown",
-                                options=[
-                                    {"label": "Displayed Data", "value": "window_data"},
-                                    {"label": "Exclusions Data", "value": "exclsion_data"},
-                                    {"label": "Original Data", "value": "original_data"}
-                                ],
-                                value="Displayed Data",
-                                placeholder="Select a model",
-                                style={"flex": "1"}
-                            ),
-                            html.Button(
-                                html.I(className="fas fa-download", style={"fontSize": "24px", "color": "white"}),
-                                n_clicks=0,
-                                id="download-button",
-                                style={
-                                    "marginLeft": "10px",
-                                    "backgroundColor": "#4682B4",
-                                    "border": "none",
-                                    "color": "white",
-                                    "padding": "10px",
-                                    "borderRadius": "5px",
-                                    "cursor": "pointer",
-                                    "fontSize": "20px"
-
-                                }
-                            )
-                        ]
-                    ),
-                    html.Div(
-                        style={"flex": "1", "padding": "10px", "minWidth": "300px"},
-                        children=[
-                            dash_table.DataTable(
-                                id="metric_table",
-                                sort_action='native',
-                                columns=[
-                                    {"name": "Model Name", "id": "policy"},
-                                    {"name": "Total Profit", "id": "PnL"},
-                                    {"name": "Profit per MWh", "id": "per MWh"},
-                                    {"name": "Win Percentage", "id": "win %"}
-                                ],
-                                style_table={"overflowX": "auto"},
-                                style_cell={"padding": "10px", "textAlign": "center", "border": "1px solid #ddd"},
-                                style_header={"backgroundColor": "#f4f4f4", "fontWeight": "bold"},
-                                style_data_conditional=[
-                                {
-                                    "if": {"filter_query": '{policy} = "PJMvirts Captain Hindsight"'},  # Match value in "policy" column
-                                    "backgroundColor": policy_colors["Captain Hindsight"],             # Green
-                                    "color": "white"
-                                },
-                                {
-                                    "if": {"filter_query": '{policy} = "PJMvirts Pricetaker Short"'},  # Match value in "policy" column
-                                    "backgroundColor": policy_colors["Pricetaker Short"],              # Orange
-                                    "color": "white"
-                                },
-                                {
-                                    "if": {"filter_query": '{policy} = "PJMvirts Pricetaker Long"'},   # Match value in "policy" column
-                                    "backgroundColor": policy_colors["Pricetaker Long"],               # Blue
-                                    "color": "white"
-                                }
+                        ),
+                        html.Div(
+                            style={"display": "flex", "alignItems": "center", "marginBottom": "10px"},
+                            children=[
+                                html.Label("Rank by", style={"marginRight": "10px"}),
+                                dcc.Dropdown(
+                                    id="metric-dropdown",
+                                    options=[{"label": name, "value": name} for name in metrics.METRICS],
+                                    value="PnL",
+                                    clearable=False,
+                                    style={"flex": "1"}
+                                ),
+                                dcc.Checklist(
+                                    id="risk-columns",
+                                    options=[{"label": "Risk metrics", "value": "risk"}],
+                                    value=[],
+                                    style={"marginLeft": "10px"}
+                                ),
                             ]
-                            )
-                        ]
-                    ),
-                    dcc.Download(id="download-dataframe-csv")
-                ]
-            )
-        ]
-    )
-])
+                        ),
+                        html.Div(
+                            style={"flex": "1", "padding": "10px", "minWidth": "300px"},
+                            children=[
+                                dash_table.DataTable(
+                                    id="metric_table",
+                                    sort_action='native',
+                                    columns=table_columns("PnL", risk=False),
+                                    style_table={"overflowX": "auto"},
+                                    style_cell={"padding": "10px", "textAlign": "center", "border": "1px solid #ddd"},
+                                    style_header={"backgroundColor": "#f4f4f4", "fontWeight": "bold"},
+                                    style_data_conditional=[],  # one color per policy of the dataset (see palette.py)
+                                )
+                            ]
+                        ),
+                        # What-if: the ranking with each month of a year excluded in turn
+                        html.Div(
+                            style={"padding": "10px", "marginTop": "20px"},
+                            children=[
+                                html.Div(
+                                    style={"display": "flex", "alignItems": "center", "marginBottom": "10px"},
+                                    children=[
+                                        html.Label("Exclude each month of", style={"marginRight": "10px"}),
+                                        dcc.Dropdown(
+                                            id="scenario-year",
+                                            options=[{"label": str(year), "value": year} for year in years],
+                                            value=min_date and min_date.year,
+                                            clearable=False,
+                                            style={"width": "120px"}
+                                        ),
+                                        html.Button(
+                                            "Compare Rankings",
+                                            id="scenario-button",
+                                            n_clicks=0,
+                                            style={
+                                                "marginLeft": "10px",
+                                                "backgroundColor": "#4682B4",
+                                                "border": "none",
+                                                "color": "white",
+                                                "padding": "10px",
+                                                "borderRadius": "5px",
+                                                "cursor": "pointer"
+                                            }
+                                        ),
+                                    ]
+                                ),
+                                dash_table.DataTable(
+                                    id="scenario-table",
+                                    sort_action='native',
+                                    style_table={"overflowX": "auto"},
+                                    style_cell={"padding": "10px", "textAlign": "center", "border": "1px solid #ddd"},
+                                    style_header={"backgroundColor": "#f4f4f4", "fontWeight": "bold"},
+                                )
+                            ]
+                        )
+                    ]
+                )
+            ]
+        )
+    ])
+
+app.layout = serve_layout
 
 
 @app.callback(
-    [Output("graph", "figure",allow_duplicate=True),
-    Output("metric_table", "data",allow_duplicate=True),
+    [Output("chart-series", "data",allow_duplicate=True),
+    Output("chart-window", "data",allow_duplicate=True),
+    Output("table-data", "data",allow_duplicate=True),
     Output('toggle-area-container', 'style'),
     Output('area-toggle','value')
     ],
     [
     Input('reset-chart-toggle-button','n_clicks'),
     ],
+    [State("metric-dropdown", "value"), State("risk-columns", "value"), State("chart-type-dropdown", "value"), State("session-id", "data")],
     prevent_initial_call=True
 )
-def toggle_area(n_clicks):
+def toggle_area(n_clicks, metric, risk, chart_type, session_id):
     ctx = dash.callback_context
     button_id = ctx.triggered[0]["prop_id"].split(".")[0]
     if button_id =='reset-chart-toggle-button':
         # Fetch the data and summary from the board
-        global board
-        board = logic.Leaderboard() # Doing reset by initializing the class again
+        board = session_store.new(session_store.load(session_id).dataset.source) # Doing reset by initializing the class again
+        # the controls the reset leaves alone keep applying to the new board
+        board.set_metric(metric)
+        board.show_risk(bool(risk))
+        board.chart_type = chart_type
+        session_store.save(session_id, board)
         summary_data = board.summarize()
-        
-        # Generate the chart using the helper function
-        fig = create_figure(
-            board.exclusions_df,
-            x_col="date",
-            y_col=board.chart_type,
-            title="Leaderboard Data",
-            x_label="Date",
-            y_label="Profit Cumulative"
-        )
+
         # Prepare the table data using the helper function
         summary_table_data = prepare_table_data(summary_data)
-        return fig, summary_table_data, {'display': 'none'}, []
-    return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+        return chart_series(board), chart_window(board), summary_table_data, {'display': 'none'}, []
+    return dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update
+
+# The chart is drawn in the browser from the daily series: switching the chart type,
+# the area mode or the window never waits for the server
+app.clientside_callback(
+    ClientsideFunction(namespace="leaderboard", function_name="render_chart"),
+    Output("graph", "figure"),
+    Input("chart-series", "data"),
+    Input("chart-window", "data"),
+    Input("chart-type-dropdown", "value"),
+    Input("area-toggle", "value"),
+    State("graph-width", "data"),
+)
+
+# The table is sent column by column, with numbers as typed arrays, and rebuilt here
+app.clientside_callback(
+    ClientsideFunction(namespace="leaderboard", function_name="table_rows"),
+    Output("metric_table", "data"),
+    Input("table-data", "data"),
+)
+
+# The graph's width in pixels decides how many points are worth drawing per trace
+app.clientside_callback(
+    """
+    function(figure) {
+        var graph = document.getElementById("graph");
+        return graph ? graph.offsetWidth : window.dash_clientside.no_update;
+    }
+    """,
+    Output("graph-width", "data"),
+    Input("graph", "figure"),
+)
+
+# Only the selected tab is shown; the others keep their state
+app.clientside_callback(
+    ClientsideFunction(namespace="leaderboard", function_name="show_tab"),
+    Output("profit-chart-tab", "style"),
+    Output("wins-losses-container", "style"),
+    Output("rank-history-tab", "style"),
+    Input("tabs", "value"),
+)
+
+app.clientside_callback(
+    ClientsideFunction(namespace="leaderboard", function_name="render_wins_losses"),
+    Output("wins-losses-graph", "figure"),
+    Output("pnl-histogram-graph", "figure"),
+    Input("wins-losses", "data"),
+)
+
+app.clientside_callback(
+    ClientsideFunction(namespace="leaderboard", function_name="render_ranks"),
+    Output("rank-graph", "figure"),
+    Input("rank-history", "data"),
+)
+
+# The last day of each series is all live mode needs to know about the chart on screen
+app.clientside_callback(
+    ClientsideFunction(namespace="leaderboard", function_name="series_tails"),
+    Output("graph-tail", "data"),
+    Input("chart-series", "data"),
+)
 
 @app.callback(
-    [Output("graph", "figure",allow_duplicate=True),
-    Output("metric_table", "data",allow_duplicate=True),
-     Output('toggle-area-container', 'style',allow_duplicate=True),
+    [
+        Output("chart-series", "data", allow_duplicate=True),
+        Output("table-data", "data", allow_duplicate=True),
+        Output("metric_table", "style_data_conditional", allow_duplicate=True),
+        Output("live-version", "data", allow_duplicate=True),
     ],
-    [Input('graph', 'relayoutData'),
+    Input("live-interval", "n_intervals"),
+    [
+        State("session-id", "data"),
+        State("graph-tail", "data"),
+        State("live-version", "data"),
     ],
-     State("area-toggle", "value"),
     prevent_initial_call=True
 )
-def pan_graph(relayoutData,area_toggle):
-    if relayoutData:
-        if ('xaxis.range[0]' in relayoutData or 'yaxis.range[0]' in relayoutData) and len(area_toggle)==0:
-
-                start_date = relayoutData['xaxis.range[0]']
-                end_date = relayoutData['xaxis.range[1]']
-                # Convert the date string to a datetime object
-                start_datetime_object = datetime.strptime(start_date, "%Y-%m-%d %H:%M:%S.%f")
-                end_datetime_object = datetime.strptime(end_date, "%Y-%m-%d %H:%M:%S.%f")
-                start_date_date_only = start_datetime_object.date()
-                end_date_date_only = end_datetime_object.date()
-                board.pan(start_date_date_only,end_date_date_only)
-                # Prepare the table data using the helper function
-                summary_data = board.summarize()
-                summary_table_data = prepare_table_data(summary_data)
-                return dash.no_update, summary_table_data, {'display': 'block'}
-        elif ('xaxis.range[0]' in relayoutData or 'yaxis.range[0]' in relayoutData) and len(area_toggle)>0:
-                start_date = relayoutData['xaxis.range[0]']
-                end_date = relayoutData['xaxis.range[1]']
-                # Convert the date string to a datetime object
-                start_datetime_object = datetime.strptime(start_date, "%Y-%m-%d %H:%M:%S.%f")
-                end_datetime_object = datetime.strptime(end_date, "%Y-%m-%d %H:%M:%S.%f")
-                start_date_date_only = start_datetime_object.date()
-                end_date_date_only = end_datetime_object.date()
-                board.pan(start_date_date_only,end_date_date_only)
-                # Generate the chart using the helper function
-                fig = create_figure(
-                    board.window,
-                    x_col="date",
-                    y_col=board.chart_type,
-                    title="Leaderboard Data",
-                    x_label="Date",
-                    y_label="Profit Cumulative"
-                )
-                # Prepare the table data using the helper function
-                summary_data = board.summarize()
-                summary_table_data = prepare_table_data(summary_data)
-                return fig, summary_table_data, {'display': 'block'}
-    return dash.no_update, dash.no_update, dash.no_update
+def push_live_update(n_intervals, session_id, tails, seen_version):
+    """
+    Sends only what changed since the page's last poll: the new days of each series,
+    appended to the chart's store, and the refreshed table
+    """
+    board = session_store.load(session_id)
+    if board.dataset.version == seen_version or tails is None:
+        raise PreventUpdate
+
+    import live
+
+    series = table_styles = dash.no_update
+    days = live.new_days(board, tails)
+    chunk = transport.series_chunk(days, logic.PROFITS)
+    if chunk:
+        series = Patch()
+        series["chunks"].append(chunk)
+        # a policy new to the page may take another's palette slot: resend all the colors
+        if set(days["policy"].cast(pl.Utf8)) - {tail["name"] for tail in tails}:
+            colors = policy_colors(board)
+            series["colors"] = colors
+            table_styles = palette.table_styles(colors)
+
+    summary_table_data = prepare_table_data(board.summarize())
+    return series, summary_table_data, table_styles, board.dataset.version
+
+# Scroll-zoom fires a relayout per wheel step: wait until the viewport has been still
+# for VIEWPORT_DEBOUNCE_MS and only send the last one. Y-axis-only relayouts never
+# reach the server, and each viewport carries a number so the server can drop stale ones.
+app.clientside_callback(
+    """
+    function(relayoutData, debounceMs) {
+        var no_update = window.dash_clientside.no_update;
+        if (!relayoutData) {
+            return no_update;
+        }
+        var range = relayoutData["xaxis.range"];
+        var start = range ? range[0] : relayoutData["xaxis.range[0]"];
+        var end = range ? range[1] : relayoutData["xaxis.range[1]"];
+        if (start === undefined || end === undefined) {
+            return no_update;
+        }
+
+        var state = window.leaderboardViewport = window.leaderboardViewport || {seq: 0};
+        var seq = ++state.seq;
+        return new Promise(function(resolve) {
+            setTimeout(function() {
+                // a newer relayout in the meantime supersedes this one
+                resolve(seq === state.seq ? {start: start, end: end, seq: seq} : no_update);
+            }, debounceMs);
+        });
+    }
+    """,
+    Output("viewport", "data"),
+    Input("graph", "relayoutData"),
+    State("viewport-debounce", "data"),
+    prevent_initial_call=True
+)
 
 @app.callback(
-    [
-        Output("graph", "figure",allow_duplicate=True),
-        Output("metric_table", "data",allow_duplicate=True),
+    [Output("chart-window", "data",allow_duplicate=True),
+    Output("table-data", "data",allow_duplicate=True),
+     Output('toggle-area-container', 'style',allow_duplicate=True),
     ],
+    [Input('viewport', 'data'),
+    ],
+     State("session-id", "data"),
+    prevent_initial_call=True
+)
+def pan_graph(viewport,session_id):
+    if not viewport:
+        raise PreventUpdate
+    seq = viewport["seq"]
+    if not session_store.claim(session_id, "viewport", seq):
+        raise PreventUpdate # a newer viewport is already being computed
+
+    board = session_store.load(session_id)
+    board.pan(parse_axis_date(viewport["start"]).date(), parse_axis_date(viewport["end"]).date())
+    # the table covers the whole history outside area mode: only the window moves
+    summary_data = board.summarize() if board.area_only else None
+
+    # Give up if a newer viewport arrived meanwhile: its result, and its saved
+    # window, replace ours
+    if not session_store.is_latest(session_id, "viewport", seq):
+        raise PreventUpdate
+    session_store.save(session_id, board)
+
+    if summary_data is None:
+        return chart_window(board), dash.no_update, {'display': 'block'}
+
+    # Prepare the table data using the helper function
+    summary_table_data = prepare_table_data(summary_data)
+    return chart_window(board), summary_table_data, {'display': 'block'}
+
+@app.callback(
+    Output("table-data", "data",allow_duplicate=True),
     [
         Input("area-toggle", "value"),  # Input from the dropdown for chart type
        
     ],
+    State("session-id", "data"),
     prevent_initial_call=True
 )
-def togle_area_enabled(area_toggle):
-    if len(area_toggle)>0:
+def togle_area_enabled(area_toggle, session_id):
+    # the chart is redrawn clientside; only the table depends on the area mode
+    board = session_store.load(session_id)
+    if bool(area_toggle) != board.area_only:
         board.toggle()
-        summary_data = board.summarize()
-        fig = create_figure(
-            board.window,
-            x_col="date",
-            y_col=board.chart_type,
-            title="Leaderboard Data",
-            x_label="Date",
-            y_label="Profit Cumulative"
-        )
+    session_store.save(session_id, board)
+    summary_data = board.summarize()
 
-        # Prepare the table data using the helper function
-        summary_table_data = prepare_table_data(summary_data)
-        return fig, summary_table_data
-    else:
-        board.toggle()
-        summary_data = board.summarize()
-        fig = create_figure(
-            board.exclusions_df,
-            x_col="date",
-            y_col=board.chart_type,
-            title="Leaderboard Data",
-            x_label="Date",
-            y_label="Profit Cumulative"
-        )
-        fig.update_layout(
-            xaxis=dict(
-                range=[board.window_start, board.window_end]  # Set the x-axis range
-            )
-        )
-        # Prepare the table data using the helper function
-        summary_table_data = prepare_table_data(summary_data)
-        return fig, summary_table_data
+    # Prepare the table data using the helper function
+    return prepare_table_data(summary_data)
 
 @app.callback(
-    [
-        Output("graph", "figure",allow_duplicate=True),
-        Output("metric_table", "data",allow_duplicate=True),
-    ],
-    [
-        Input("chart-type-dropdown", "value"),  # Input from the dropdown for chart type
-    ],
+    Input("chart-type-dropdown", "value"),  # Input from the dropdown for chart type
+    State("session-id", "data"),
     prevent_initial_call=True
 )
-def update_dropdown(chart_type):
+def update_dropdown(chart_type, session_id):
     """
-    Update the chart and table based on the current data in the leaderboard.
+    Remembers the chart type of the session; the chart is redrawn clientside and the
+    table does not depend on it
     """
+    board = session_store.load(session_id)
     board.chart_type  = chart_type
-    original_data = board.original
-    summary_data = board.summarize()
+    session_store.save(session_id, board)
 
-    # Create figure based on selected chart type and corresponding column
-    fig = create_figure(
-        original_data,
-        x_col="date",
-        y_col= board.chart_type,
-        title="Leaderboard Data",
-        x_label="Date",
-        y_label="Profit Cumulative"
-    )
-    
+@app.callback(
+    Output("table-data", "data", allow_duplicate=True),
+    Input("metric-dropdown", "value"),
+    State("session-id", "data"),
+    prevent_initial_call=True
+)
+def update_metric(metric, session_id):
+    """
+    Ranks the table (and picks the top nodes) on another metric of the registry
+    """
+    board = session_store.load(session_id)
+    try:
+        board.set_metric(metric)
+    except ValueError:
+        raise PreventUpdate
+    session_store.save(session_id, board)
 
-    # Prepare table data from the summary
-    summary_table_data = prepare_table_data(summary_data)
+    return prepare_table_data(board.summarize())
 
-    # Return the updated chart and table data
-    return fig, summary_table_data
+@app.callback(
+    Output("table-data", "data", allow_duplicate=True),
+    Input("risk-columns", "value"),
+    State("session-id", "data"),
+    prevent_initial_call=True
+)
+def update_risk_columns(risk, session_id):
+    """
+    Adds the risk metrics to the table, or drops them (they are computed from the
+    daily series, so only when shown)
+    """
+    board = session_store.load(session_id)
+    board.show_risk(bool(risk))
+    session_store.save(session_id, board)
+
+    return prepare_table_data(board.summarize())
+
+@app.callback(
+    Output("metric_table", "columns"),
+    Input("metric-dropdown", "value"),
+    Input("risk-columns", "value"),
+)
+def update_table_columns(metric, risk):
+    """
+    Shows the risk metric columns when asked for, or when ranking on one of them
+    """
+    return table_columns(metric, bool(risk))
 
 @app.callback(
     [
-        Output("graph", "figure"),
-        Output("metric_table", "data"),
+        Output("chart-series", "data"),
+        Output("chart-window", "data"),
+        Output("table-data", "data"),
+        Output("metric_table", "style_data_conditional"),
+        Output("date-picker-range", "start_date"),
+        Output("date-picker-range", "end_date"),
+        Output("scenario-year", "options"),
+        Output("scenario-year", "value"),
+        Output("live-version", "data"),
     ],
     [Input("header_title", "children"),
-    ]
+    ],
+    State("session-id", "data"),
 )
-def update_chart_and_table(header_title):
+def update_chart_and_table(header_title, session_id):
     """
     Update the chart and table based on the current data in the leaderboard.
     """
     # Fetch the data and summary from the board
-    exclusions_data = board.exclusions_df
+    board = session_store.load(session_id)
     summary_data = board.summarize()
 
-    # Generate the chart using the helper function
-    fig = create_figure(
-        exclusions_data,
-        x_col="date",
-        y_col=board.chart_type,
-        title="Leaderboard Data",
-        x_label="Date",
-        y_label="Profit Cumulative"
-    )
-
     # Prepare the table data using the helper function
     summary_table_data = prepare_table_data(summary_data)
 
-    # Return the chart and the table data
-    return fig, summary_table_data
+    # Return the chart's series, the table data, the table's policy colors, the date controls
+    # and the dataset version they show, so live mode only sends what changes after it
+    table_styles = palette.table_styles(policy_colors(board))
+    return (
+        chart_series(board), chart_window(board), summary_table_data, table_styles,
+        *date_controls(board), board.dataset.version,
+    )
+
+@app.callback(
+    [
+        Output("chart-series", "data", allow_duplicate=True),
+        Output("chart-window", "data", allow_duplicate=True),
+        Output("table-data", "data", allow_duplicate=True),
+        Output("metric_table", "style_data_conditional", allow_duplicate=True),
+        Output("date-picker-range", "start_date", allow_duplicate=True),
+        Output("date-picker-range", "end_date", allow_duplicate=True),
+        Output("scenario-year", "options", allow_duplicate=True),
+        Output("scenario-year", "value", allow_duplicate=True),
+        Output("toggle-area-container", "style", allow_duplicate=True),
+        Output("area-toggle", "value", allow_duplicate=True),
+        Output("live-version", "data", allow_duplicate=True),
+    ],
+    Input("dataset-dropdown", "value"),
+    [State("metric-dropdown", "value"), State("risk-columns", "value"), State("session-id", "data")],
+    prevent_initial_call=True
+)
+def select_dataset(source, metric, risk, session_id):
+    """
+    Switches the session to another dataset of the registry: a fresh leaderboard of
+    its whole history, ranked by the selected metric. The dataset is read on first use.
+    """
+    if source not in data.registry().values():
+        raise PreventUpdate # only registered datasets can be opened
+
+    board = session_store.new(source)
+    board.set_metric(metric)
+    board.show_risk(bool(risk))
+    session_store.save(session_id, board)
+
+    table_styles = palette.table_styles(policy_colors(board))
+    return (
+        chart_series(board), chart_window(board), prepare_table_data(board.summarize()), table_styles,
+        *date_controls(board), {"display": "none"}, [], board.dataset.version,
+    )
+
+@app.callback(
+    [Output("scenario-table", "columns"), Output("scenario-table", "data")],
+    Input("scenario-button", "n_clicks"),
+    [State("scenario-year", "value"), State("session-id", "data")],
+    prevent_initial_call=True
+)
+def compare_scenarios(n_clicks, year, session_id):
+    """
+    The rank of every policy (or policy / node) in the current table and with each
+    month of the year excluded in turn, one row per scenario
+    """
+    if not year:
+        raise PreventUpdate # the year options are filled by the first render
+    board = session_store.load(session_id)
+    results = board.evaluate_scenarios([{"name": "current"}] + board.monthly_scenarios(year))
+
+    entry = pl.col("policy").cast(pl.Utf8)
+    if "node" in results.columns:
+        entry = pl.concat_str([entry, pl.col("node").cast(pl.Utf8)], separator=" / ")
+    ranks = results.select("scenario", entry.alias("entry"), "rank")\
+        .pivot(values="rank", index="scenario", columns="entry", maintain_order=True)
+
+    columns = [{"name": "Scenario" if name == "scenario" else name, "id": name} for name in ranks.columns]
+    return columns, ranks.to_dicts()
+
+@app.callback(
+    Output("wins-losses", "data"),
+    Input("tabs", "value"),
+    Input("table-data", "data"),
+    State("wins-losses", "data"),
+    State("session-id", "data"),
+    prevent_initial_call=True
+)
+def update_wins_losses(tab, table_data, current, session_id):
+    """
+    Sends the Wins vs Losses data while its tab is open; reopening the tab with the
+    table unchanged only redraws what the page already has
+    """
+    ctx = dash.callback_context
+    changed = any(trigger["prop_id"] == "table-data.data" for trigger in ctx.triggered)
+    if tab != "tab-2":
+        if changed and current is not None:
+            return None # stale: fetched again when the tab is next opened
+        raise PreventUpdate
+    if not changed and current is not None:
+        raise PreventUpdate
+
+    return wins_losses_data(session_store.load(session_id))
+
+@app.callback(
+    Output("rank-history", "data"),
+    Input("tabs", "value"),
+    Input("table-data", "data"),
+    State("session-id", "data"),
+    prevent_initial_call=True
+)
+def update_rank_history(tab, table_data, session_id):
+    """
+    Recomputes the rank history whenever the table changes, while its tab is open
+    """
+    if tab != "tab-3":
+        raise PreventUpdate
+    return rank_series(session_store.load(session_id))
 
 # Callback to toggle visibility of the slider container
 @app.callback(
@@ -482,107 +905,114 @@ def toggle_slider_visibility(selected_values):
 # Callback
 @app.callback(
     [
-         Output("graph", "figure", allow_duplicate=True),
-        Output("metric_table", "data", allow_duplicate=True),
+         Output("chart-series", "data", allow_duplicate=True),
+        Output("table-data", "data", allow_duplicate=True),
         Output("date-range-checklist", "value")
     ],
     [
         Input("exclude-button", "n_clicks"),
+        Input("include-button", "n_clicks"),
+        Input("undo-button", "n_clicks"),
+        Input("redo-button", "n_clicks"),
         Input("reset-button", "n_clicks"),
     ],
     [
         State("date-picker-range", "start_date"),
-        State("date-picker-range", "end_date")
+        State("date-picker-range", "end_date"),
+        State("session-id", "data"),
     ],
     prevent_initial_call=True
 )
-def handle_buttons(exclude_clicks, reset_clicks, start_date, end_date):
+def handle_buttons(exclude_clicks, include_clicks, undo_clicks, redo_clicks, reset_clicks, start_date, end_date, session_id):
     ctx = dash.callback_context
     if not ctx.triggered:
         return dash.no_update, dash.no_update, dash.no_update
 
+    board = session_store.load(session_id)
     button_id = ctx.triggered[0]["prop_id"].split(".")[0]
     
-    if button_id == "exclude-button":
-        if start_date and end_date:
-            # Create figure based on the original data
+    if button_id in ("exclude-button", "include-button"):
+        if not (start_date and end_date):
+            return dash.no_update, dash.no_update, dash.no_update  # If no date range is selected, do nothing
+        if button_id == "exclude-button":
             board.exclude_region(date.fromisoformat(start_date), date.fromisoformat(end_date))
-            fig = create_figure(
-                board.exclusions_df,  # Use the original data (no modification)
-                x_col="date",
-                y_col=board.chart_type,
-                title="Leaderboard Data with Excluded Range",
-                x_label="Date",
-                y_label="Profit Cumulative",
-            )
-            fig.add_shape(
-                    type="rect",
-                    x0=start_date,  # Ensure format matches x-axis
-                    x1=end_date,
-                    y0=0,
-                    y1=1,  # Full height of the plot (spanning the entire y-axis range)
-                    xref="x",
-                    yref="paper",  # Use paper ref for vertical span (not affected by data)
-                    fillcolor="rgba(128, 128, 128, 0.3)",  # Light gray
-                    layer="above",  # Ensure the exclusion area is above the lines, but not affecting the data itself
-                    line=dict(width=0)  # No border for the shaded area
-                )
-            
+        else:
+            board.include_region(date.fromisoformat(start_date), date.fromisoformat(end_date))
+    elif button_id == "undo-button":
+        board.undo_exclusion()
+    elif button_id == "redo-button":
+        board.redo_exclusion()
+    elif button_id == "reset-button":
+        board.reset_exclusions()
+    else:
+        return dash.no_update, dash.no_update, dash.no_update
 
-            # Prepare table data from the summary
-            summary_data = board.summarize()
-            summary_table_data = prepare_table_data(summary_data)
+    session_store.save(session_id, board)
+    series = chart_series(board)  # the series without the excluded ranges
 
-            return fig, summary_table_data, ["date_range_enable"]
+    # Prepare table data from the summary
+    summary_data = board.summarize()
+    summary_table_data = prepare_table_data(summary_data)
 
-        else:
-            return dash.no_update, dash.no_update, dash.no_update  # If no date range is selected, do nothing
+    return series, summary_table_data, ["date_range_enable"] if board.exclusions else []
 
-    elif button_id == "reset-button":
-        board.exclusions_df = board.original
-        fig = create_figure(
-            board.exclusions_df,  # Use original data (no exclusions)
-            x_col="date",
-            y_col=board.chart_type,
-            title="Leaderboard Data",
-            x_label="Date",
-            y_label="Profit Cumulative",
-        )
+# The download link points at the export route, for this session and the chosen options
+app.clientside_callback(
+    """
+    function(selection, format, gzip, sessionId) {
+        var query = new URLSearchParams({session: sessionId, data: selection || "window_data", format: format});
+        if (gzip && gzip.length) {
+            query.set("gzip", "1");
+        }
+        return "/export?" + query.toString();
+    }
+    """,
+    Output("download-link", "href"),
+    Input("download-dropdown", "value"),
+    Input("download-format", "value"),
+    Input("download-gzip", "value"),
+    Input("session-id", "data"),
+)
 
-        summary_data = board.summarize()
-        summary_table_data = prepare_table_data(summary_data)
+@app.server.route("/export")
+def export_data():
+    """
+    Streams the selected rows of the session's leaderboard as CSV, Parquet or Arrow IPC
+    """
+    import export
+
+    args = flask.request.args
+    board = session_store.load(args.get("session"))
+    return export.response(
+        board,
+        args.get("data", "window_data"),
+        args.get("format", "csv"),
+        gzip=args.get("gzip") == "1",
+    )
 
-        return fig, summary_table_data, []
 
-    return dash.no_update, dash.no_update, dash.no_update
+@app.server.route("/ready")
+def readiness():
+    """
+    Readiness probe: 200 once the default dataset is loaded, 503 until then (or if
+    loading it failed)
+    """
+    error = data.warm_error()
+    if data.ready():
+        return flask.jsonify(ready=True)
+    return flask.jsonify(ready=False, error=error and str(error)), 503
 
-@app.callback(
-    Output("download-dataframe-csv", "data"),
-    [Input("download-button", "n_clicks"),
-     Input("download-dropdown", "value")
-     ]
-)
-def download_excel(n_clicks, dropdown_value):
-
-    if n_clicks>0 and dropdown_value != None:
-        if dropdown_value == 'window_data':
-            table_data= board.window
-        elif dropdown_value == 'exclusion_data':
-            table_data = board.exclusions_df
-        elif dropdown_value == 'original_data':
-            table_data == board.original
-        # Convert DataFrame to CSV
-        csv_string = table_data.write_csv()
-        # Encode the CSV string as a downloadable base64 string
-        b64 = base64.b64encode(csv_string.encode()).decode()
-        # Return the download data
-        return dict(content=b64, filename="trading_data.csv")
-    else:
-        return dash.no_update
 
+# Opt-in instrumentation: stage timings on /metrics and in Server-Timing headers, and
+# sampled profiles of the requests slower than LEADERBOARD_PROFILE_SLOW_MS
+if os.environ.get("LEADERBOARD_METRICS") == "1":
+    import instrument
 
+    slow_ms = os.environ.get("LEADERBOARD_PROFILE_SLOW_MS")
+    instrument.install(app, globals(), slow_ms=float(slow_ms) if slow_ms else None)
 
 
 if __name__ == "__main__":
+    start_background()
     app.run_server(debug=False, host= "0.0.0.0", port=8000)
 
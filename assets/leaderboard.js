@@ -0,0 +1,353 @@
+// Clientside rendering of the profit and rank charts.
+//
+// The server sends the daily profit sums of each policy once (the "chart-series"
+// store, as typed arrays) and appends new days in chunks; switching the chart type,
+// the area mode or the window only redraws here, without a round trip.
+
+(function() {
+    var MAX_POINTS = 4000;      // hard cap on the points drawn per trace
+    var DEFAULT_POINTS = 2000;  // budget when the graph width is unknown
+    var POINTS_PER_PIXEL = 2;
+    var OUTLINE_POINTS = 200;   // per side, for the days around the visible range
+    var DAY_MS = 86400000;
+
+    var DEFAULT_COLOR = "#A0A0A0";  // policies the server sent no color for (palette.py)
+    var DASHES = ["solid", "dot", "dash", "dashdot", "longdash", "longdashdot"];
+    var TABS = ["tab-1", "tab-2", "tab-3"];  // profit chart, wins vs losses, rank history
+
+    var ARRAYS = {
+        f8: Float64Array, f4: Float32Array,
+        i4: Int32Array, u4: Uint32Array,
+        i2: Int16Array, u2: Uint16Array,
+        i1: Int8Array, u1: Uint8Array
+    };
+
+    // {dtype, bdata} as sent by transport.typed_array, to a typed array
+    function decode(spec) {
+        var binary = atob(spec.bdata);
+        var bytes = new Uint8Array(binary.length);
+        for (var i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+        return new ARRAYS[spec.dtype](bytes.buffer);
+    }
+
+    function toDay(isoDate) {
+        return Math.floor(Date.parse(isoDate.slice(0, 10)) / DAY_MS);
+    }
+
+    function toIso(day) {
+        return new Date(day * DAY_MS).toISOString().slice(0, 10);
+    }
+
+    function pointsBudget(pixelWidth) {
+        if (!pixelWidth) {
+            return DEFAULT_POINTS;
+        }
+        return Math.min(MAX_POINTS, Math.max(100, POINTS_PER_PIXEL * pixelWidth));
+    }
+
+    // Indices keeping the first, last, minimum and maximum point of budget/2 buckets,
+    // as downsampling by min/max on the server did
+    function minmax(y, budget) {
+        var n = y.length;
+        var keep = [];
+        if (n <= budget) {
+            for (var i = 0; i < n; i++) {
+                keep.push(i);
+            }
+            return keep;
+        }
+        var buckets = Math.max(1, Math.floor(budget / 2));
+        for (var b = 0; b < buckets; b++) {
+            var lo = Math.floor(b * n / buckets);
+            var hi = Math.floor((b + 1) * n / buckets);
+            var low = lo, high = lo;
+            for (var j = lo + 1; j < hi; j++) {
+                if (y[j] < y[low]) { low = j; }
+                if (y[j] > y[high]) { high = j; }
+            }
+            keep.push(Math.min(low, high));
+            if (low !== high) {
+                keep.push(Math.max(low, high));
+            }
+        }
+        if (keep[0] !== 0) { keep.unshift(0); }
+        if (keep[keep.length - 1] !== n - 1) { keep.push(n - 1); }
+        return keep;
+    }
+
+    // The chunks of the store merged into one series per policy, in order of appearance
+    function mergeChunks(series, column) {
+        var byName = {};
+        var order = [];
+        series.chunks.forEach(function(chunk) {
+            chunk.forEach(function(entry) {
+                if (!(entry.name in byName)) {
+                    byName[entry.name] = {x: [], y: []};
+                    order.push(entry.name);
+                }
+                byName[entry.name].x.push(decode(entry.x));
+                byName[entry.name].y.push(decode(entry[column]));
+            });
+        });
+        return order.map(function(name) {
+            return {name: name, x: concat(byName[name].x, Int32Array), y: concat(byName[name].y, Float64Array)};
+        });
+    }
+
+    function concat(arrays, Type) {
+        if (arrays.length === 1) {
+            return arrays[0];
+        }
+        var total = arrays.reduce(function(sum, array) { return sum + array.length; }, 0);
+        var merged = new Type(total);
+        var offset = 0;
+        arrays.forEach(function(array) {
+            merged.set(array, offset);
+            offset += array.length;
+        });
+        return merged;
+    }
+
+    // [{name, values}] of a column-wise payload (transport.table_columns)
+    function decodeColumns(table) {
+        return table.columns.map(function(name) {
+            var values = table.data[name];
+            return {name: name, values: values.bdata !== undefined ? decode(values) : values};
+        });
+    }
+
+    function columnsByName(table) {
+        var byName = {};
+        decodeColumns(table).forEach(function(column) {
+            byName[column.name] = column.values;
+        });
+        return byName;
+    }
+
+    // the color the server picked for a policy ("colors" of a payload)
+    function colorOf(colors, policy) {
+        return (colors && colors[policy]) || DEFAULT_COLOR;
+    }
+
+    // minmax over [lo, hi) of y, as indices into y
+    function minmaxRange(y, lo, hi, budget) {
+        return minmax(y.subarray(lo, hi), budget).map(function(i) { return lo + i; });
+    }
+
+    function trace(policy, lo, hi, budget, colors, visibleLo, visibleHi) {
+        // cumulative profit over the days [lo, hi)
+        var cumulative = new Float64Array(hi - lo);
+        var total = 0;
+        for (var i = lo; i < hi; i++) {
+            total += policy.y[i];
+            cumulative[i - lo] = total;
+        }
+        var keep;
+        if (visibleLo === undefined) {
+            keep = minmax(cumulative, budget);
+        } else {
+            // the whole budget for the visible days [visibleLo, visibleHi), and a
+            // coarse outline of the others, so zooming in shows every visible day
+            var a = visibleLo - lo, b = visibleHi - lo;
+            keep = minmaxRange(cumulative, 0, a, OUTLINE_POINTS)
+                .concat(minmaxRange(cumulative, a, b, budget))
+                .concat(minmaxRange(cumulative, b, cumulative.length, OUTLINE_POINTS));
+        }
+        return {
+            x: keep.map(function(i) { return toIso(policy.x[lo + i]); }),
+            y: keep.map(function(i) { return cumulative[i]; }),
+            mode: "lines",
+            name: policy.name,
+            line: {color: colorOf(colors, policy.name)}
+        };
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        leaderboard: {
+            render_chart: function(series, chartWindow, chartType, areaToggle, graphWidth) {
+                var no_update = window.dash_clientside.no_update;
+                if (!series || !chartWindow) {
+                    return no_update;
+                }
+                var areaOnly = areaToggle && areaToggle.length > 0;
+                var triggered = window.dash_clientside.callback_context.triggered.map(function(t) {
+                    return t.prop_id;
+                });
+
+                var start = toDay(chartWindow.start);
+                var end = toDay(chartWindow.end);
+                var budget = pointsBudget(graphWidth);
+                var traces = mergeChunks(series, chartType).map(function(policy) {
+                    // the window clips the chart in area mode; otherwise the whole
+                    // history is drawn, resampled for the days in the window
+                    var lo = 0, hi = policy.x.length;
+                    while (lo < hi && policy.x[lo] < start) { lo++; }
+                    while (hi > lo && policy.x[hi - 1] > end) { hi--; }
+                    if (areaOnly) {
+                        return trace(policy, lo, hi, budget, series.colors);
+                    }
+                    return trace(policy, 0, policy.x.length, budget, series.colors, lo, hi);
+                }).filter(function(t) { return t.x.length > 0; });
+
+                var excluded = !areaOnly && series.exclusions.length > 0;
+                var layout = {
+                    title: {text: excluded ? "Leaderboard Data with Excluded Range" : "Leaderboard Data"},
+                    xaxis: {title: {text: "Date"}},
+                    yaxis: {title: {text: "Profit Cumulative"}},
+                    uirevision: areaOnly ? "area" : "leaderboard", // keep the user's zoom within a mode
+                    shapes: excluded ? series.exclusions.map(function(range) {
+                        return {
+                            type: "rect", x0: range[0], x1: range[1], y0: 0, y1: 1,
+                            xref: "x", yref: "paper",
+                            fillcolor: "rgba(128, 128, 128, 0.3)", layer: "above", line: {width: 0}
+                        };
+                    }) : []
+                };
+                if (!areaOnly && triggered.indexOf("area-toggle.value") >= 0) {
+                    // leaving area mode: show the whole history, zoomed on the window
+                    layout.xaxis.range = [chartWindow.start, chartWindow.end];
+                }
+                return {data: traces, layout: layout};
+            },
+
+            // one style per tab container, showing only the selected one
+            show_tab: function(tab) {
+                return TABS.map(function(value) {
+                    return {display: value === tab ? "block" : "none"};
+                });
+            },
+
+            // win/loss counts per policy, and the distribution of daily PnL
+            render_wins_losses: function(data) {
+                var no_update = window.dash_clientside.no_update;
+                if (!data) {
+                    return [no_update, no_update];
+                }
+                var counts = columnsByName(data.counts);
+                var outcomes = [
+                    ["win_count_long", "Wins (long)", 1],
+                    ["win_count_short", "Wins (short)", 0.6],
+                    ["loss_count_long", "Losses (long)", 1],
+                    ["loss_count_short", "Losses (short)", 0.6]
+                ];
+                var bars = outcomes.map(function(outcome) {
+                    var win = outcome[0].indexOf("win") === 0;
+                    return {
+                        type: "bar",
+                        name: outcome[1],
+                        x: counts.policy,
+                        y: Array.from(counts[outcome[0]]),
+                        marker: {color: win ? "#54C158" : "#E4572E", opacity: outcome[2]}
+                    };
+                });
+
+                var histogram = columnsByName(data.histogram);
+                var byPolicy = {};
+                var order = [];
+                for (var i = 0; i < histogram.policy.length; i++) {
+                    var policy = histogram.policy[i];
+                    if (!(policy in byPolicy)) {
+                        byPolicy[policy] = {x: [], y: [], width: []};
+                        order.push(policy);
+                    }
+                    byPolicy[policy].x.push((histogram.start[i] + histogram.end[i]) / 2);
+                    byPolicy[policy].width.push(histogram.end[i] - histogram.start[i]);
+                    byPolicy[policy].y.push(histogram.days[i]);
+                }
+                var distribution = order.map(function(policy) {
+                    return {
+                        type: "bar",
+                        name: policy,
+                        x: byPolicy[policy].x,
+                        y: byPolicy[policy].y,
+                        width: byPolicy[policy].width,
+                        marker: {color: colorOf(data.colors, policy)},
+                        opacity: 0.6
+                    };
+                });
+
+                return [
+                    {
+                        data: bars,
+                        layout: {title: {text: "Wins vs Losses"}, barmode: "group", yaxis: {title: {text: "Count"}}}
+                    },
+                    {
+                        data: distribution,
+                        layout: {
+                            title: {text: "Daily PnL Distribution"},
+                            barmode: "overlay",
+                            xaxis: {title: {text: "Daily PnL"}},
+                            yaxis: {title: {text: "Days"}}
+                        }
+                    }
+                ];
+            },
+
+            // each table row's rank by day; "policy / node" rows take their policy's
+            // color, one dash pattern per node
+            render_ranks: function(history) {
+                if (!history) {
+                    return window.dash_clientside.no_update;
+                }
+                var nodes = {};
+                var traces = mergeChunks(history, "rank").map(function(row) {
+                    var policy = row.name.split(" / ")[0];
+                    nodes[policy] = (nodes[policy] || 0) + 1;
+                    return {
+                        x: Array.prototype.map.call(row.x, toIso),
+                        y: Array.prototype.map.call(row.y, function(rank) { return isNaN(rank) ? null : rank; }),
+                        mode: "lines",
+                        line: {
+                            shape: "hv",
+                            color: colorOf(history.colors, policy),
+                            dash: DASHES[(nodes[policy] - 1) % DASHES.length]
+                        },
+                        name: row.name
+                    };
+                });
+                return {
+                    data: traces,
+                    layout: {
+                        title: {text: "Rank by " + history.metric + " over time"},
+                        xaxis: {title: {text: "Date"}},
+                        yaxis: {title: {text: "Rank"}, autorange: "reversed", dtick: 1},
+                        uirevision: history.metric
+                    }
+                };
+            },
+
+            // the rows of the metric table from its column-wise payload
+            table_rows: function(table) {
+                if (!table) {
+                    return window.dash_clientside.no_update;
+                }
+                var columns = decodeColumns(table);
+                var length = columns.length ? columns[0].values.length : 0;
+                var rows = [];
+                for (var i = 0; i < length; i++) {
+                    var row = {};
+                    columns.forEach(function(column) {
+                        var value = column.values[i];
+                        row[column.name] = typeof value === "number" && isNaN(value) ? null : value;
+                    });
+                    rows.push(row);
+                }
+                return rows;
+            },
+
+            // the last day of each policy's series, so the server only sends newer days
+            series_tails: function(series) {
+                if (!series) {
+                    return window.dash_clientside.no_update;
+                }
+                return mergeChunks(series, "profit_total").filter(function(policy) {
+                    return policy.x.length > 0;
+                }).map(function(policy) {
+                    return {name: policy.name, x: toIso(policy.x[policy.x.length - 1])};
+                });
+            }
+        }
+    });
+})();
@@ -0,0 +1,419 @@
+import argparse
+import functools
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from datetime import date, timedelta
+
+import numpy as np
+import polars as pl
+
+import data
+import logic
+
+
+REPEAT = 20 # timed runs per benchmark
+WARMUP = 2 # untimed runs first
+OUTPUT = "bench_results.json"
+
+POLICIES = ["PJMvirts Captain Hindsight", "PJMvirts Pricetaker Short", "PJMvirts Pricetaker Long"]
+FIRST_DAY = date(2022, 9, 16) # the default leaderboard window starts here
+
+
+def synthetic(days=761, policies=3, nodes=4, seed=0):
+    """
+    A random leaderboard dataset with the columns and types of data.SCHEMA
+
+    Every policy trades every node every day, so it has days * policies * nodes rows
+    """
+    rng = np.random.default_rng(seed)
+    names = POLICIES[:policies] + [f"PJMvirts Policy {i}" for i in range(len(POLICIES), policies)]
+    node_ids = [f"{node_id}.0" for node_id in rng.choice(50_000_000, nodes, replace=False)]
+
+    keys = pl.DataFrame({"policy": names}).join(pl.DataFrame({"node": node_ids}), how="cross")\
+        .join(pl.DataFrame({"date": pl.date_range(FIRST_DAY, FIRST_DAY + timedelta(days=days - 1), eager=True)}), how="cross")
+    n = keys.height
+
+    profit_long = rng.normal(20, 150, n)
+    profit_short = rng.normal(40, 200, n)
+    mwh_long = rng.gamma(2.0, 20.0, n)
+    mwh_short = rng.gamma(2.0, 30.0, n)
+    win_long = rng.integers(0, 25, n)
+    win_short = rng.integers(0, 25, n)
+    frame = keys.with_columns(
+        pl.Series("profit_total", profit_long + profit_short),
+        pl.Series("mwh_total", mwh_long + mwh_short),
+        pl.Series("profit_long", profit_long),
+        pl.Series("mwh_long", mwh_long),
+        pl.Series("profit_short", profit_short),
+        pl.Series("mwh_short", mwh_short),
+        pl.Series("win_count_long", win_long),
+        pl.Series("win_count_short", win_short),
+        pl.Series("loss_count_long", 24 - win_long),
+        pl.Series("loss_count_short", 24 - win_short),
+    )
+    return frame.select(list(data.SCHEMA)).cast(data.SCHEMA)
+
+
+def exclusion_ranges(count, days, length=5):
+    """
+    count disjoint ranges of `length` days spread evenly over the dataset
+    """
+    step = days // (count + 1) if count else days
+    return [
+        (FIRST_DAY + timedelta(days=step * i), FIRST_DAY + timedelta(days=step * i + length - 1))
+        for i in range(1, count + 1)
+    ]
+
+
+class PeakMemory():
+    """
+    Peak memory while the block runs: Python allocations through tracemalloc, and the
+    process resident set (which includes polars' native buffers) by sampling
+    /proc/self/statm where it exists
+    """
+    INTERVAL = 0.002
+
+    def __enter__(self):
+        self.rss_peak = self.rss_start = _rss()
+        self._stopped = threading.Event()
+        self._sampler = None
+        if self.rss_start is not None:
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+        tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc):
+        _, self.python_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self.rss_peak = max(self.rss_peak, _rss())
+
+    def _sample(self):
+        while not self._stopped.wait(self.INTERVAL):
+            self.rss_peak = max(self.rss_peak, _rss())
+
+    @property
+    def rss_growth(self):
+        return None if self.rss_start is None else self.rss_peak - self.rss_start
+
+
+def _rss():
+    # resident set size in bytes, or None off Linux
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def measure(run, setup=None, repeat=REPEAT, warmup=WARMUP, cold=True):
+    """
+    Times `run` over `repeat` runs, after `warmup` untimed ones
+
+    `setup` is called untimed before each run and its result passed to `run`. With
+    cold=True the query cache is cleared before each run, so cached results do not
+    hide the cost of the queries. `run` may return the payload it produced (bytes or
+    str) to have its size reported.
+    """
+    def once():
+        if cold:
+            logic.query_cache.clear()
+        argument = setup() if setup is not None else None
+        start = time.perf_counter()
+        payload = run(argument) if setup is not None else run()
+        return time.perf_counter() - start, payload
+
+    for _ in range(warmup):
+        once()
+
+    timings, payload = [], None
+    for _ in range(repeat):
+        elapsed, payload = once()
+        timings.append(elapsed)
+
+    # memory is measured on a separate run, as tracing slows the code down
+    with PeakMemory() as memory:
+        once()
+
+    timings = np.array(timings) * 1000
+    return {
+        "runs": repeat,
+        "p50_ms": round(float(np.percentile(timings, 50)), 3),
+        "p95_ms": round(float(np.percentile(timings, 95)), 3),
+        "mean_ms": round(float(timings.mean()), 3),
+        "min_ms": round(float(timings.min()), 3),
+        "payload_bytes": len(payload) if isinstance(payload, (bytes, str)) else None,
+        "peak_python_bytes": memory.python_peak,
+        "peak_rss_growth_bytes": memory.rss_growth,
+    }
+
+
+def operation_benchmarks(factory, ranges, measure, topn=2):
+    """
+    The Leaderboard methods and chart/table helpers on the hot paths
+    """
+    import app
+
+    base = factory()
+    for start, end in ranges:
+        base.exclude_region(start, end)
+    state = base.get_state()
+    fresh = lambda: logic.Leaderboard.from_state(state)
+
+    mid = FIRST_DAY + (base.get_date_range()[1] - FIRST_DAY) / 2
+    zoom = (mid - timedelta(days=60), mid + timedelta(days=60))
+
+    def ranked():
+        board = fresh()
+        board.grouping = True
+        board.set_topn(topn)
+        return board
+
+    def zoomed():
+        board = fresh()
+        board.zoom_in(*zoom)
+        board.toggle()
+        return board
+
+    summary = base.summarize()
+
+    return {
+        "summarize": measure(lambda board: board.summarize(), fresh),
+        "summarize_area": measure(lambda board: board.summarize(), zoomed),
+        "summarize_topn": measure(lambda board: board.summarize(), ranked),
+        "filter_topn": measure(lambda board: board.filter_topn(), ranked),
+        "node_metrics": measure(lambda board: board.node_metrics(), fresh),
+        "rank_history": measure(lambda board: board.rank_history(), fresh),
+        "evaluate_scenarios[months]": measure(
+            lambda board: board.evaluate_scenarios(board.monthly_scenarios(mid.year)), fresh
+        ),
+        "exclude_region": measure(lambda board: board.exclude_region(zoom[0], zoom[1]), fresh),
+        "exclude_region+summarize": measure(
+            lambda board: (board.exclude_region(zoom[0], zoom[1]), board.summarize()), fresh
+        ),
+        "zoom_in": measure(lambda board: board.zoom_in(*zoom), fresh),
+        "zoom_in+summarize": measure(lambda board: (board.zoom_in(*zoom), board.summarize()), zoomed),
+        "chart_series": measure(lambda board: json.dumps(app.chart_series(board)), fresh),
+        "prepare_table_data": measure(lambda: json.dumps(app.prepare_table_data(summary)), cold=False),
+    }
+
+
+def callback_benchmarks(factory, ranges, measure, source):
+    """
+    Every server-side Dash callback end to end, through the HTTP endpoint the browser
+    calls, and the export route; the payload is the response body sent back
+    """
+    import app
+    import sessions
+
+    # every session, new or reset, and every dataset of the dropdown is the benchmark's
+    app.session_store = sessions.SessionStore(factory=lambda _source=None: factory())
+    data.registry = lambda store=None: {"synthetic": source}
+    client = app.app.server.test_client()
+    dependencies = client.get("/_dash-dependencies").get_json()
+
+    board = factory()
+    for start, end in ranges:
+        board.exclude_region(start, end)
+    state = board.get_state()
+    end = board.get_date_range()[1]
+    mid = FIRST_DAY + (end - FIRST_DAY) / 2
+    picked = (mid - timedelta(days=30), mid + timedelta(days=30))
+
+    def session(area_only=False):
+        # a session already in the benchmark state
+        session_id = f"bench-{time.perf_counter_ns()}"
+        app.session_store.backend.set(session_id, dict(state, area_only=area_only))
+        return session_id
+
+    def call(trigger, values, output=None):
+        body = _callback_request(dependencies, trigger, values, output)
+        def run(session_id):
+            body["state"] = [
+                dict(entry, value=session_id) if entry["id"] == "session-id" else entry for entry in body["state"]
+            ]
+            response = client.post("/_dash-update-component", json=body)
+            assert response.status_code in (200, 204), response.data[:500]
+            return response.data
+        return run
+
+    def export(selection, format):
+        def run(session_id):
+            response = client.get("/export", query_string={"session": session_id, "data": selection, "format": format})
+            assert response.status_code == 200, response.data[:500]
+            return response.get_data()
+        return run
+
+    viewport = {"start": f"{picked[0]} 00:00:00.000", "end": f"{picked[1]} 00:00:00.000", "seq": 1}
+    # the chart as the page holds it, up to date: a live poll then only refreshes the table
+    last_days = board.daily_profits().group_by("policy").agg(pl.col("date").max())
+    tails = [{"name": policy, "x": day.isoformat()} for policy, day in last_days.iter_rows()]
+    return {
+        "update_chart_and_table": measure(call("header_title.children", {"header_title.children": "Leaderboard"}), session),
+        "update_dropdown": measure(call("chart-type-dropdown.value", {"chart-type-dropdown.value": "profit_long"}), session),
+        "handle_buttons[exclude]": measure(call("exclude-button.n_clicks", {
+            "exclude-button.n_clicks": 1,
+            "date-picker-range.start_date": picked[0].isoformat(),
+            "date-picker-range.end_date": picked[1].isoformat(),
+        }), session),
+        "handle_buttons[include]": measure(call("include-button.n_clicks", {
+            "include-button.n_clicks": 1,
+            "date-picker-range.start_date": picked[0].isoformat(),
+            "date-picker-range.end_date": picked[1].isoformat(),
+        }), session),
+        "handle_buttons[undo]": measure(call("undo-button.n_clicks", {"undo-button.n_clicks": 1}), session),
+        "handle_buttons[redo]": measure(call("redo-button.n_clicks", {"redo-button.n_clicks": 1}), session),
+        "handle_buttons[reset]": measure(call("reset-button.n_clicks", {"reset-button.n_clicks": 1}), session),
+        "pan_graph": measure(call("viewport.data", {"viewport.data": viewport}), session),
+        "pan_graph[area]": measure(call("viewport.data", {"viewport.data": viewport}), lambda: session(area_only=True)),
+        "togle_area_enabled": measure(call("area-toggle.value", {"area-toggle.value": ["enable"]}), session),
+        "toggle_area[reset]": measure(call("reset-chart-toggle-button.n_clicks", {
+            "reset-chart-toggle-button.n_clicks": 1,
+            "metric-dropdown.value": "PnL",
+            "chart-type-dropdown.value": "profit_total",
+        }), session),
+        "update_metric": measure(call("metric-dropdown.value", {"metric-dropdown.value": "Sharpe"}, "table-data"), session),
+        "update_risk_columns": measure(call("risk-columns.value", {"risk-columns.value": ["risk"]}, "table-data"), session),
+        "update_table_columns": measure(call("metric-dropdown.value", {
+            "metric-dropdown.value": "Sharpe", "risk-columns.value": [],
+        }, "metric_table.columns"), session),
+        "select_dataset": measure(call("dataset-dropdown.value", {"dataset-dropdown.value": source, "metric-dropdown.value": "PnL"}), session),
+        "push_live_update": measure(call("live-interval.n_intervals", {
+            "live-interval.n_intervals": 1, "graph-tail.data": tails, "live-version.data": "stale",
+        }), session),
+        "compare_scenarios": measure(call("scenario-button.n_clicks", {
+            "scenario-button.n_clicks": 1, "scenario-year.value": mid.year,
+        }), session),
+        "update_wins_losses": measure(call("tabs.value", {"tabs.value": "tab-2"}, "wins-losses"), session),
+        "update_rank_history": measure(call("tabs.value", {"tabs.value": "tab-3"}, "rank-history"), session),
+        "toggle_slider_visibility": measure(call("date-range-checklist.value", {"date-range-checklist.value": ["date_range_enable"]}), session),
+        "export[csv]": measure(export("window_data", "csv"), session),
+        "export[parquet]": measure(export("window_data", "parquet"), session),
+    }
+
+
+def _callback_request(dependencies, trigger, values, output=None):
+    # the body dash-renderer posts to /_dash-update-component when `trigger` changes,
+    # for the callback writing `output` if several listen to it
+    dependency = next(
+        dependency for dependency in dependencies
+        if not dependency.get("clientside_function")
+        and any(f"{item['id']}.{item['property']}" == trigger for item in dependency["inputs"])
+        and (output is None or output in dependency["output"])
+    )
+    outputs = []
+    for output in [] if dependency.get("no_output") else dependency["output"].strip(".").split("..."):
+        output_id, prop = output.split("@")[0].rsplit(".", 1)
+        outputs.append({"id": output_id, "property": prop})
+
+    fill = lambda items: [
+        {"id": item["id"], "property": item["property"], "value": values.get(f"{item['id']}.{item['property']}")}
+        for item in items
+    ]
+    return {
+        "output": dependency["output"],
+        "outputs": outputs if len(outputs) != 1 or dependency["output"].startswith("..") else outputs[0],
+        "inputs": fill(dependency["inputs"]),
+        "state": fill(dependency["state"]),
+        "changedPropIds": [trigger],
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """
+    Prints the p50/p95 of every benchmark against a previous results file
+    """
+    for group in ("operations", "callbacks"):
+        for name, current in results.get(group, {}).items():
+            previous = baseline.get(group, {}).get(name)
+            if previous is None:
+                continue
+            ratio = current["p50_ms"] / previous["p50_ms"] if previous["p50_ms"] else float("nan")
+            print(
+                f"{name:<28} p50 {previous['p50_ms']:>9.2f} -> {current['p50_ms']:>9.2f} ms ({ratio:5.2f}x)"
+                f"   p95 {previous['p95_ms']:>9.2f} -> {current['p95_ms']:>9.2f} ms"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the leaderboard queries and Dash callbacks on synthetic data")
+    parser.add_argument("--days", type=int, default=761)
+    parser.add_argument("--policies", type=int, default=3)
+    parser.add_argument("--nodes", type=int, default=4)
+    parser.add_argument("--exclusions", type=int, default=3, help="excluded date ranges set before each benchmark")
+    parser.add_argument("--topn", type=int, default=2, help="nodes kept per policy by the top-N benchmarks")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--warm", action="store_true", help="keep the query cache between runs")
+    parser.add_argument("--lazy", action="store_true", help="benchmark lazy Leaderboards")
+    parser.add_argument("--skip-callbacks", action="store_true")
+    parser.add_argument("--output", default=OUTPUT, help="where to write the JSON results")
+    parser.add_argument("--compare", help="a previous results file to compare against")
+    args = parser.parse_args()
+
+    timed = functools.partial(measure, repeat=args.repeat)
+    if args.warm:
+        timed = functools.partial(timed, cold=False)
+
+    with tempfile.TemporaryDirectory() as folder:
+        source = os.path.join(folder, "synthetic.parquet")
+        frame = synthetic(args.days, args.policies, args.nodes)
+        frame.write_parquet(source)
+        ranges = exclusion_ranges(args.exclusions, args.days)
+        factory = functools.partial(logic.Leaderboard, source, lazy=args.lazy)
+
+        # reading the source and building its cube happen once per process, not per query
+        started = time.perf_counter()
+        data.load(source).cube
+        load_ms = (time.perf_counter() - started) * 1000
+
+        results = {
+            "commit": _commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "polars": pl.__version__,
+            "parameters": {
+                "days": args.days, "policies": args.policies, "nodes": args.nodes, "rows": frame.height,
+                "exclusions": args.exclusions, "topn": args.topn, "repeat": args.repeat, "warm": args.warm, "lazy": args.lazy,
+            },
+            "load_ms": round(load_ms, 3),
+            "operations": operation_benchmarks(factory, ranges, timed, args.topn),
+        }
+        if not args.skip_callbacks:
+            results["callbacks"] = callback_benchmarks(factory, ranges, timed, source)
+
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2)
+
+    for group in ("operations", "callbacks"):
+        for name, stats in results.get(group, {}).items():
+            payload = f"{stats['payload_bytes']:>10,} B" if stats["payload_bytes"] is not None else " " * 12
+            print(f"{name:<28} p50 {stats['p50_ms']:>9.2f} ms   p95 {stats['p95_ms']:>9.2f} ms   {payload}")
+    print(f"results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as previous:
+            compare(results, json.load(previous))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import numpy as np
+import polars as pl
+
+from datetime import date
+
+from intervals import within
+
+
+MEASURES = ["profit_total", "profit_short", "profit_long", "mwh_total", "win_count_long", "win_count_short"]
+COUNTS = ["win_count_long", "win_count_short"]
+KEYS = ["policy", "node", "date"]
+
+EPOCH = date(1970, 1, 1)
+_DAY_OFFSET = 1 << 31 # keeps day numbers positive inside the 32 low bits of a key
+
+
+def day_number(day):
+    """
+    Days since 1970-01-01, the physical value of a polars Date
+    """
+    return (day - EPOCH).days
+
+
+def sums(columns):
+    """
+    Sum expressions of the given measures: counts in Int64 and everything else in
+    Float64, whatever narrower type they are stored in
+    """
+    return [pl.col(column).cast(pl.Int64 if column in COUNTS else pl.Float64).sum() for column in columns]
+
+
+def _daily(frame):
+    # row-level data summed per (policy, node, date); "rows" counts the raw rows
+    return frame.group_by(KEYS).agg(*sums(MEASURES), pl.len().cast(pl.Int64).alias("rows"))
+
+
+class _Segment():
+    """
+    Daily totals of one slice of the data, sorted by (policy, node, date), with prefix sums
+    """
+    def __init__(self, daily):
+        daily = daily.sort(KEYS)\
+            .with_columns(pl.struct(["policy", "node"]).rle_id().alias("group_id"))
+        self.daily = daily.drop("group_id") # kept to merge segments
+
+        self.groups = daily.group_by("group_id", maintain_order=True)\
+            .agg(pl.first("policy"), pl.first("node"))\
+            .drop("group_id")
+
+        group_ids = daily["group_id"].cast(pl.Int64).to_numpy()
+        days = daily["date"].cast(pl.Int32).cast(pl.Int64).to_numpy()
+        self.keys = (group_ids << 32) + days + _DAY_OFFSET
+        self._group_keys = np.arange(self.groups.height, dtype=np.int64) << 32
+
+        values = daily.select(pl.col([*MEASURES, "rows"]).cast(pl.Float64)).to_numpy()
+        self.prefix = np.zeros((values.shape[0] + 1, values.shape[1]))
+        np.cumsum(values, axis=0, out=self.prefix[1:])
+
+    @property
+    def height(self):
+        return self.daily.height
+
+    def totals(self, intervals):
+        sums = np.zeros((self.groups.height, self.prefix.shape[1]))
+        for start, end in intervals:
+            lo = np.searchsorted(self.keys, self._group_keys + (day_number(start) + _DAY_OFFSET), "left")
+            hi = np.searchsorted(self.keys, self._group_keys + (day_number(end) + _DAY_OFFSET), "right")
+            sums += self.prefix[hi] - self.prefix[lo]
+
+        columns = [pl.Series(name, sums[:, i]) for i, name in enumerate([*MEASURES, "rows"])]
+        return self.groups.with_columns(columns)
+
+    def rows(self, intervals):
+        # the raw rows summed into the days inside the intervals, all groups together
+        rows = 0
+        for start, end in intervals:
+            lo = np.searchsorted(self.keys, self._group_keys + (day_number(start) + _DAY_OFFSET), "left")
+            hi = np.searchsorted(self.keys, self._group_keys + (day_number(end) + _DAY_OFFSET), "right")
+            rows += (self.prefix[hi, -1] - self.prefix[lo, -1]).sum()
+        return int(rows)
+
+
+class DailyCube():
+    """
+    Daily (policy, node, date) totals of the leaderboard measures, with prefix sums
+
+    Rows are sorted by (policy, node, date) and prefix[i] holds the sum of the first i
+    rows, so the total of any group over any date interval is the difference of two
+    prefix rows found by binary search. A query over k intervals therefore costs
+    O(groups * k * log rows) whatever the length of the history.
+
+    Appended data goes into a new segment, so an append costs the size of the delta.
+    Segments are merged log-structured style (a segment at least half the size of the
+    one before it is merged into it), keeping their number logarithmic.
+    """
+    def __init__(self, frame):
+        self.segments = [_Segment(_daily(frame))]
+
+    def extend(self, frame):
+        """
+        Folds new row-level data into the cube
+        """
+        segments = self.segments + [_Segment(_daily(frame))]
+        while len(segments) > 1 and segments[-1].height * 2 >= segments[-2].height:
+            newer, older = segments.pop(), segments.pop()
+            merged = pl.concat([older.daily, newer.daily])\
+                .group_by(KEYS)\
+                .agg(pl.col([*MEASURES, "rows"]).sum())
+            segments.append(_Segment(merged))
+
+        # swapped in one assignment so concurrent queries see either version whole
+        self.segments = segments
+
+    def memory(self):
+        """
+        Bytes held by the segments: their daily rows, keys and prefix sums
+        """
+        return sum(
+            segment.daily.estimated_size() + segment.groups.estimated_size() + segment.keys.nbytes + segment.prefix.nbytes
+            for segment in self.segments
+        )
+
+    def totals(self, intervals):
+        """
+        Per (policy, node) sums of the measures over the union of disjoint date intervals
+
+        Groups without any row in the intervals are left out, as a group_by would do
+        """
+        segments = self.segments
+        totals = segments[0].totals(intervals)
+        if len(segments) > 1:
+            totals = pl.concat([totals, *(segment.totals(intervals) for segment in segments[1:])])\
+                .group_by(["policy", "node"], maintain_order=True)\
+                .agg(pl.col([*MEASURES, "rows"]).sum())
+
+        return totals\
+            .filter(pl.col("rows") > 0)\
+            .drop("rows")\
+            .with_columns(pl.col(COUNTS).round(0).cast(pl.Int64))
+
+    def rows(self, intervals):
+        """
+        The number of row-level rows inside the union of disjoint date intervals
+        """
+        return sum(segment.rows(intervals) for segment in self.segments)
+
+    def daily(self, intervals):
+        """
+        The (policy, node, date) rows of the cube inside the union of disjoint date intervals
+        """
+        segments = self.segments
+        daily = pl.concat([segment.daily for segment in segments])
+        if len(segments) > 1:
+            daily = daily.group_by(KEYS).agg(pl.col([*MEASURES, "rows"]).sum())
+
+        return daily.filter(within(intervals)).drop("rows")
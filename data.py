@@ -0,0 +1,821 @@
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+import polars as pl
+
+from collections import OrderedDict
+from datetime import date, timedelta
+
+from cube import KEYS, DailyCube
+
+
+DEFAULT_SOURCE = "leaderboard_example.json"
+CACHE_DIR = ".cache"
+# root of the partitioned store: market=<market>/year=<year>/month=<month>/*.parquet,
+# one dataset per market
+STORE_DIR = os.environ.get("LEADERBOARD_STORE", "store")
+# bytes of frames and cubes kept in memory across datasets; beyond it the least
+# recently used datasets are released (and read again on next use)
+MEMORY_BUDGET = int(os.environ.get("LEADERBOARD_MEMORY_MB", "2048")) << 20
+
+# in a market folder: the one data file of each month, and the file every write to
+# the folder rewrites, so its fingerprint is one small read rather than a walk
+PARTITION_FILE = "part-0.parquet"
+MANIFEST = "_manifest"
+STAGED = ".staged" # suffix of parts written but not published yet
+
+_PARTITION = re.compile(r"year=(\d+)[/\\]month=(\d+)[/\\][^/\\]+\.parquet$")
+
+# column types of a leaderboard dataset: dictionary-encoded names (Categorical rather
+# than Enum, as feeds can bring new nodes) and unsigned counts; profits and volumes
+# stay Float64, as in the sources, so no amount is rounded
+SCHEMA = {
+    "policy": pl.Categorical,
+    "node": pl.Categorical,
+    "date": pl.Date,
+    "profit_total": pl.Float64,
+    "mwh_total": pl.Float64,
+    "profit_long": pl.Float64,
+    "mwh_long": pl.Float64,
+    "profit_short": pl.Float64,
+    "mwh_short": pl.Float64,
+    "win_count_long": pl.UInt32,
+    "win_count_short": pl.UInt32,
+    "loss_count_long": pl.UInt32,
+    "loss_count_short": pl.UInt32,
+}
+
+# categoricals of every frame (sidecars, appended parts, feed batches) share one
+# dictionary, so they can be concatenated and joined without re-encoding
+pl.enable_string_cache()
+
+
+# columnar formats that can be scanned lazily, by file extension
+SCANNERS = {
+    ".parquet": pl.scan_parquet,
+    ".arrow": pl.scan_ipc,
+    ".ipc": pl.scan_ipc,
+    ".feather": pl.scan_ipc,
+    ".ndjson": pl.scan_ndjson,
+    ".jsonl": pl.scan_ndjson,
+}
+
+
+class Dataset():
+    """
+    A leaderboard source: one immutable frame shared by every Leaderboard
+
+    The frame is only read on first use; lazy queries scan `scan_path` instead, so
+    they only read the columns and date ranges they need. In memory it has the types
+    of SCHEMA and is sorted by date, so date ranges are found by binary search.
+
+    Rows appended after the source was written live in Arrow IPC parts under
+    `appends_dir`, one file per append, and are folded in without a reload.
+
+    A market of the partitioned store is a folder source: its scans only read the
+    year/month partitions that overlap the dates asked for.
+    """
+    def __init__(self, source, fingerprint, scan_path, frame=None, appends_dir=None, stats_path=None):
+        self.source = source
+        self.fingerprint = fingerprint
+        self.scan_path = scan_path
+        self.appends_dir = appends_dir
+        self.stats_path = stats_path
+        self.partitioned = scan_path is not None and os.path.isdir(scan_path)
+        self.parts = _list_parts(appends_dir)
+        if frame is not None and self.parts:
+            frame = _sorted_by_date(pl.concat([frame, *(pl.read_ipc(part, memory_map=True) for part in self.parts)], rechunk=False))
+        self.version = self._version()
+        self._frame = frame
+        self._stats = None
+        self._date_range = None
+        self._policies = None
+        self._cube = None
+        self._lock = threading.RLock()
+        self._building = threading.Lock() # one cube build at a time, outside _lock
+
+    @property
+    def frame(self):
+        """
+        The whole dataset in memory, read (or memory-mapped) on first use
+        """
+        with self._lock:
+            read = self._frame is None
+            if read:
+                frames = [_compact(_read_scannable(self.scan_path))]
+                frames += [pl.read_ipc(part, memory_map=True) for part in self.parts]
+                self._frame = _sorted_by_date(pl.concat(frames, rechunk=False))
+            frame = self._frame
+        if read:
+            _evict(keep=self)
+        return frame
+
+    def scan(self, intervals=None):
+        """
+        A LazyFrame over the dataset; nothing is read until it is collected
+
+        Scans of a partitioned source skip the partitions outside the given date
+        intervals (the rows of the others still need filtering)
+        """
+        if self._frame is None and self.scan_path is not None:
+            if self.partitioned:
+                scans = [_typed(scan_partitions(self.scan_path, intervals))]
+            else:
+                scans = [_typed(_scanner(self.scan_path)(self.scan_path))]
+            scans += [pl.scan_ipc(part, memory_map=True) for part in self.parts]
+            return pl.concat(scans) if len(scans) > 1 else scans[0]
+        return self.frame.lazy()
+
+    def original(self):
+        """
+        The rows as the source holds them, in its own order and column types, then the
+        appended rows in those types; a LazyFrame, for exports of the original data
+        """
+        if _scanner(self.source) is not None:
+            base = _scanner(self.source)(self.source)
+        else:
+            # JSON sources keep their parsed rows in a sidecar of their own, as the
+            # main sidecar is sorted and typed
+            path = original_path(self.source, self.fingerprint)
+            if not os.path.exists(path):
+                rows = pl.read_json(self.source) # sidecars written before it was kept
+                try:
+                    _write_cache(rows, path)
+                except OSError:
+                    path = None # read-only deployments parse the source every time
+            base = pl.scan_ipc(path, memory_map=True) if path is not None else rows.lazy()
+        schema = base.schema
+        parts = [pl.scan_ipc(part, memory_map=True).select(list(schema)).cast(dict(schema)) for part in self.parts]
+        return pl.concat([base, *parts]) if parts else base
+
+    def schema(self):
+        return self._frame.schema if self._frame is not None else self.scan().schema
+
+    def rows_within(self, intervals):
+        """
+        The rows of the in-memory frame inside the union of disjoint, sorted date
+        intervals, as zero-copy slices found by binary search on the sorted dates
+        """
+        frame = self.frame
+        if not intervals:
+            return frame.clear()
+
+        starts, ends = zip(*intervals)
+        dates = frame["date"]
+        lo = dates.search_sorted(pl.Series(starts, dtype=pl.Date), "left")
+        hi = dates.search_sorted(pl.Series(ends, dtype=pl.Date), "right")
+        slices = [frame.slice(first, last - first) for first, last in zip(lo, hi) if last > first]
+        return pl.concat(slices, rechunk=False) if slices else frame.clear()
+
+    def append(self, delta):
+        """
+        Adds new rows: written as a new part, then folded into the in-memory frame, cube
+        and date range, so the cost is the size of the delta rather than of the history
+        """
+        with self._lock:
+            delta = self._conform(delta)
+            if self.appends_dir is not None:
+                self.parts = self.parts + [self._write_part(delta)]
+            self._fold(delta)
+
+    def stage_part(self, delta):
+        """
+        Writes new rows as a staged part, which no process sees until publish_parts();
+        returns its path, or None if there is nowhere to write parts
+        """
+        if self.appends_dir is None:
+            return None
+        os.makedirs(self.appends_dir, exist_ok=True)
+        staged = f"{self._part_path()}{STAGED}"
+        self._conform(delta).write_ipc(staged)
+        return staged
+
+    def publish_parts(self, staged):
+        """
+        Makes staged parts visible at once, in order; refresh() folds them in
+        """
+        for path in staged:
+            os.replace(path, path[:-len(STAGED)])
+
+    @staticmethod
+    def discard_parts(staged):
+        """
+        Removes staged parts that will not be published
+        """
+        for path in staged:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _conform(self, delta):
+        schema = self.schema()
+        return delta.select(list(schema)).cast(schema)
+
+    def _part_path(self):
+        # named by time and process, so parts keep their order and never collide
+        return os.path.join(self.appends_dir, f"{time.time_ns():020d}-{os.getpid()}.arrow")
+
+    def _write_part(self, delta):
+        os.makedirs(self.appends_dir, exist_ok=True)
+        part = self._part_path()
+        tmp = f"{part}.tmp"
+        delta.write_ipc(tmp)
+        os.replace(tmp, part)
+        return part
+
+    def refresh(self):
+        """
+        Folds in parts appended by other processes (or published by this one) since
+        this one last looked; returns the number of new rows
+        """
+        with self._lock:
+            new_parts = [part for part in _list_parts(self.appends_dir) if part not in self.parts]
+            if not new_parts:
+                return 0
+            delta = pl.concat([pl.read_ipc(part, memory_map=True) for part in new_parts], rechunk=False)
+            self.parts = self.parts + new_parts
+            self._fold(delta)
+            return delta.height
+
+    def _fold(self, delta):
+        if self._frame is not None:
+            self._frame = _sorted_by_date(pl.concat([self._frame, delta], rechunk=False))
+        if self._cube is not None:
+            self._cube.extend(delta)
+        if self._date_range is not None and not delta.is_empty():
+            self._date_range = (
+                min(self._date_range[0], delta["date"].min()),
+                max(self._date_range[1], delta["date"].max()),
+            )
+        if self._policies is not None:
+            self._policies = sorted(set(self._policies).union(delta["policy"].cast(pl.Utf8).unique()))
+        self.version = self._version()
+
+    def _version(self):
+        # changes with the data; part of every query cache key
+        return f"{self.fingerprint}+{len(self.parts)}" if self.parts else self.fingerprint
+
+    def stats(self):
+        """
+        Row count, first and last date, policies and number of nodes of the source
+        (appended parts aside), kept in a JSON sidecar so they are known without
+        reading the data again
+        """
+        with self._lock:
+            if self._stats is None:
+                self._stats = _read_stats(self.stats_path)
+            if self._stats is None:
+                base = self._frame.lazy() if self.scan_path is None else _typed(_scanner(self.scan_path)(self.scan_path))
+                self._stats = _compute_stats(base)
+                if self.stats_path is not None:
+                    try:
+                        _write_stats(self._stats, self.stats_path)
+                    except OSError:
+                        pass # read-only deployments recompute them once per process
+        return self._stats
+
+    def date_range(self):
+        """
+        First and last date of the dataset, computed once
+
+        The bounds of the source come from its stats; only appended parts are read
+        """
+        if self._date_range is None:
+            stats = self.stats()
+            bounds = [(_to_date(stats["start"]), _to_date(stats["end"]))]
+            bounds += [_bounds(pl.scan_ipc(part, memory_map=True)) for part in self.parts]
+            bounds = [bound for bound in bounds if bound[0] is not None]
+            if bounds:
+                self._date_range = (min(start for start, _ in bounds), max(end for _, end in bounds))
+            else:
+                self._date_range = (None, None)
+        return self._date_range
+
+    def policies(self):
+        """
+        Every policy of the dataset, computed once
+
+        The policies of the source come from its stats; only appended parts are read
+        """
+        if self._policies is None:
+            policies = set(self.stats()["policies"])
+            for part in self.parts:
+                policies.update(pl.scan_ipc(part, memory_map=True).select(pl.col("policy").cast(pl.Utf8).unique()).collect()["policy"])
+            self._policies = sorted(policies)
+        return self._policies
+
+    @property
+    def cube(self):
+        """
+        The daily pre-aggregated cube of the frame, built on first use
+
+        The build runs outside _lock, so stats and date ranges (the page layout) do
+        not wait for it; rows folded in meanwhile make it start over from the new frame.
+        """
+        cube = self._cube
+        if cube is not None:
+            return cube
+        built = False
+        with self._building:
+            while True:
+                with self._lock:
+                    if self._cube is not None:
+                        cube = self._cube
+                        break
+                    frame, version = self.frame, self.version
+                fresh = DailyCube(frame)
+                with self._lock:
+                    if self.version == version:
+                        self._cube = cube = fresh
+                        built = True
+                        break
+        if built:
+            _evict(keep=self)
+        return cube
+
+    def row_count(self, intervals):
+        """
+        The number of rows inside the disjoint date intervals, from the cube; None
+        until the cube is built
+        """
+        cube = self._cube
+        return cube.rows(intervals) if cube is not None else None
+
+    def memory(self):
+        """
+        Bytes held by the in-memory frame and cube, if they were read
+        """
+        frame, cube = self._frame, self._cube
+        return (frame.estimated_size() if frame is not None else 0) + (cube.memory() if cube is not None else 0)
+
+    def release(self):
+        """
+        Drops the in-memory frame and cube, to be read again on next use; returns
+        whether it did (sources kept only in memory, or in use, are not released)
+        """
+        if self.scan_path is None or not self._lock.acquire(blocking=False):
+            return False
+        try:
+            self._frame = None
+            self._cube = None
+        finally:
+            self._lock.release()
+        return True
+
+
+_datasets = OrderedDict()  # absolute source path -> Dataset, least recently used first
+_lock = threading.Lock()
+_warm = {}  # absolute source path -> None once loaded and its cube built, or the error that stopped it
+
+
+def warm(source=DEFAULT_SOURCE):
+    """
+    Loads a source and builds its cube, so the first queries do not pay for it;
+    ready(source) is true once done. Errors are kept for warm_error() and re-raised.
+    """
+    key = os.path.abspath(source)
+    try:
+        load(source).cube
+    except Exception as error:
+        _warm[key] = error
+        raise
+    _warm[key] = None
+
+
+def ready(source=DEFAULT_SOURCE):
+    """
+    Whether warm(source) has finished
+    """
+    key = os.path.abspath(source)
+    return key in _warm and _warm[key] is None
+
+
+def warm_error(source=DEFAULT_SOURCE):
+    """
+    The error that stopped warm(source), if any
+    """
+    return _warm.get(os.path.abspath(source))
+
+
+def cached_date_range(source=DEFAULT_SOURCE):
+    """
+    First and last date of a source without loading it: from the loaded dataset if
+    there is one, else from its stats sidecar; (None, None) before its first load
+    """
+    dataset = _datasets.get(os.path.abspath(source))
+    if dataset is not None:
+        return dataset.date_range()
+    try:
+        stats = _read_stats(stats_path(source, fingerprint(source)))
+    except OSError:
+        stats = None
+    if stats is None:
+        return None, None
+    return _to_date(stats["start"]), _to_date(stats["end"])
+
+
+def markets(store=STORE_DIR):
+    """
+    The markets of the partitioned store that have data, as market name -> source folder
+    """
+    if not os.path.isdir(store):
+        return {}
+    return {
+        entry[len("market="):]: os.path.join(store, entry)
+        for entry in sorted(os.listdir(store))
+        if entry.startswith("market=") and _partitions(os.path.join(store, entry))
+    }
+
+
+def registry(store=STORE_DIR):
+    """
+    Every dataset the app can show, as label -> source: the default source, then
+    the markets of the store. Nothing is read until a dataset is loaded.
+    """
+    sources = {}
+    if os.path.exists(DEFAULT_SOURCE):
+        sources[os.path.splitext(os.path.basename(DEFAULT_SOURCE))[0]] = DEFAULT_SOURCE
+    sources.update(markets(store))
+    return sources
+
+
+def scan_partitions(folder, intervals=None):
+    """
+    A LazyFrame over the Parquet files of a market folder, reading only the
+    year/month partitions that overlap the disjoint date intervals (all by default)
+    """
+    files = [
+        path for (year, month), path in _partitions(folder)
+        if intervals is None or _overlaps(year, month, intervals)
+    ]
+    if not files:
+        return pl.LazyFrame(schema=SCHEMA)
+    # the partition values are in the paths, and the dates in the rows already
+    return pl.scan_parquet(files, hive_partitioning=False)
+
+
+def write_partitions(frame, market, store=STORE_DIR):
+    """
+    Writes rows to the store under market=<market>/year=<year>/month=<month>/, merged
+    into the one file of each month touched; returns the files written
+    """
+    folder = os.path.join(store, f"market={market}")
+    written = _merge_partitions(frame, folder)
+    _write_manifest(folder)
+    return written
+
+
+def compact(source):
+    """
+    Folds the parts appended to a market folder into its month files, and drops
+    them; returns the number of rows folded. Nothing should append to the market
+    meanwhile.
+    """
+    dataset = load(source)
+    if not dataset.partitioned:
+        raise ValueError(f"{source!r} is not a market folder of the store")
+
+    with dataset._lock:
+        parts = _list_parts(dataset.appends_dir)
+        if not parts:
+            return 0
+        delta = pl.concat([pl.read_ipc(part, memory_map=False) for part in parts])
+        _merge_partitions(delta, source)
+        for part in parts:
+            os.remove(part)
+        # the new fingerprint last, so no process carries the parts over to it
+        _write_manifest(source)
+    return delta.height
+
+
+def _merge_partitions(frame, folder):
+    months = _compact(frame)\
+        .with_columns(pl.col("date").dt.year().alias("year"), pl.col("date").dt.month().alias("month"))\
+        .partition_by(["year", "month"], as_dict=True, include_key=False, maintain_order=True)
+
+    written = []
+    for (year, month), rows in months.items():
+        month_folder = os.path.join(folder, f"year={year}", f"month={month}")
+        os.makedirs(month_folder, exist_ok=True)
+        existing = sorted(glob.glob(os.path.join(month_folder, "*.parquet")))
+        if existing:
+            rows = _compact(pl.concat([_typed(pl.scan_parquet(existing, hive_partitioning=False)).collect(), rows]))
+        path = os.path.join(month_folder, PARTITION_FILE)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        rows.write_parquet(tmp)
+        os.replace(tmp, path)
+        for old in existing:
+            if old != path:
+                os.remove(old) # files of other writers, now merged
+        written.append(path)
+    return written
+
+
+def _write_manifest(folder):
+    path = os.path.join(folder, MANIFEST)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as manifest:
+        manifest.write(f"{time.time_ns():x}-{os.getpid():x}")
+    os.replace(tmp, path)
+
+
+def fingerprint(source):
+    """
+    Cheap identity of the source file; changes whenever the file is rewritten
+
+    A market folder is identified by its manifest, rewritten by every write through
+    write_partitions or compact; folders written by other tools, without one, by the
+    size and mtime of every partition file
+    """
+    if os.path.isdir(source):
+        try:
+            with open(os.path.join(source, MANIFEST)) as manifest:
+                return manifest.read().strip()
+        except FileNotFoundError:
+            pass
+        digest = hashlib.blake2b(digest_size=8)
+        for _, path in _partitions(source):
+            stat = os.stat(path)
+            digest.update(f"{os.path.relpath(path, source)}:{stat.st_size:x}:{stat.st_mtime_ns:x};".encode())
+        return digest.hexdigest()
+    stat = os.stat(source)
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+def cache_path(source, key):
+    """
+    Location of the Arrow IPC sidecar for a given source and fingerprint
+    """
+    folder = os.path.join(os.path.dirname(os.path.abspath(source)), CACHE_DIR)
+    name = os.path.basename(source)
+    return os.path.join(folder, f"{name}.{key}.arrow")
+
+
+def appends_path(source, key):
+    """
+    Folder of the parts appended to a given source and fingerprint
+    """
+    return cache_path(source, key)[:-len(".arrow")] + ".appends"
+
+
+def original_path(source, key):
+    """
+    Location of the sidecar of a JSON source's rows as parsed, in its own order and
+    types, for exports of the original data
+    """
+    return cache_path(source, key)[:-len(".arrow")] + ".original.arrow"
+
+
+def stats_path(source, key):
+    """
+    Location of the stats sidecar (see Dataset.stats) for a given source and fingerprint
+    """
+    return cache_path(source, key)[:-len(".arrow")] + ".stats.json"
+
+
+def _list_parts(folder):
+    if folder is None or not os.path.isdir(folder):
+        return []
+    return [os.path.join(folder, entry) for entry in sorted(os.listdir(folder)) if entry.endswith(".arrow")]
+
+
+def _scanner(path):
+    if os.path.isdir(path):
+        return scan_partitions
+    return SCANNERS.get(os.path.splitext(path)[1].lower())
+
+
+def _partitions(folder):
+    # ((year, month), path) of every Parquet file of a market folder
+    paths = glob.glob(os.path.join(folder, "year=*", "month=*", "*.parquet"))
+    matches = [(_PARTITION.search(path), path) for path in sorted(paths)]
+    return [((int(match[1]), int(match[2])), path) for match, path in matches if match]
+
+
+def _overlaps(year, month, intervals):
+    first = date(year, month, 1)
+    last = (first + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+    return any(start <= last and first <= end for start, end in intervals)
+
+
+def _evict(keep):
+    """
+    Releases the least recently used datasets (but `keep`) while the frames and
+    cubes in memory add up to more than MEMORY_BUDGET
+    """
+    with _lock:
+        datasets = list(_datasets.values())
+
+    used = sum(dataset.memory() for dataset in datasets)
+    for dataset in datasets:
+        if used <= MEMORY_BUDGET:
+            break
+        size = dataset.memory()
+        if dataset is not keep and size and dataset.release():
+            used -= size
+
+
+def _read_scannable(path):
+    if _scanner(path) is pl.scan_ipc:
+        return pl.read_ipc(path, memory_map=True)
+    return _scanner(path)(path).collect()
+
+
+def _casts(schema):
+    # the columns of SCHEMA whose type differs in the given schema
+    return {name: dtype for name, dtype in SCHEMA.items() if name in schema and schema[name] != dtype}
+
+
+def _typed(lf):
+    # casts only the columns that need it, so scans of compact files keep their pushdowns
+    casts = _casts(lf.schema)
+    return lf.cast(casts) if casts else lf
+
+
+def _compact(frame):
+    """
+    The frame with the types of SCHEMA, sorted by date
+    """
+    casts = _casts(frame.schema)
+    if casts:
+        frame = frame.cast(casts)
+    return _sorted_by_date(frame)
+
+
+def _sorted_by_date(frame):
+    # rows of a day keep their order; flagged so polars can take sorted fast paths
+    if not frame["date"].is_sorted():
+        frame = frame.with_row_index("row").sort(["date", "row"]).drop("row")
+    return frame.with_columns(pl.col("date").set_sorted())
+
+
+def _bounds(lf):
+    bounds = lf.select(pl.col("date").min().alias("start"), pl.col("date").max().alias("end")).collect()
+    return bounds["start"][0], bounds["end"][0]
+
+
+def _compute_stats(lf):
+    stats = lf.select(
+        pl.len().alias("rows"),
+        pl.col("date").min().alias("start"),
+        pl.col("date").max().alias("end"),
+        pl.col("policy").cast(pl.Utf8).unique().sort().implode().alias("policies"),
+        pl.col("node").n_unique().alias("nodes"),
+    ).collect().row(0, named=True)
+    stats["start"] = stats["start"] and stats["start"].isoformat()
+    stats["end"] = stats["end"] and stats["end"].isoformat()
+    return stats
+
+
+def _read_stats(path):
+    if path is None or not os.path.exists(path):
+        return None
+    try:
+        with open(path) as stats:
+            return json.load(stats)
+    except (OSError, ValueError):
+        return None # rewritten on next use
+
+
+def _write_stats(stats, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as output:
+        json.dump(stats, output)
+    os.replace(tmp, path)
+
+
+def _to_date(value):
+    return date.fromisoformat(value) if value is not None else None
+
+
+def _write_cache(frame, path):
+    """
+    Writes the sidecar atomically
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    frame.write_ipc(tmp)
+    os.replace(tmp, path)
+
+
+def _prune(source, key, scan):
+    """
+    Drops the sidecars of older versions of the source; their appended parts are
+    carried over to the current version first (see _carry_parts), so rewriting the
+    source never loses the rows ingested since. `scan(intervals)` reads the current
+    version of the source.
+    """
+    folder = os.path.dirname(cache_path(source, key))
+    if not os.path.isdir(folder):
+        return
+
+    prefix = os.path.basename(source) + "."
+    current = f"{prefix}{key}."
+    for entry in os.listdir(folder):
+        if not entry.startswith(prefix) or entry.startswith(current) or entry.endswith(".tmp"):
+            continue
+        stale = os.path.join(folder, entry)
+        try:
+            if entry.endswith(".appends"):
+                _carry_parts(stale, appends_path(source, key), scan)
+            if os.path.isdir(stale):
+                shutil.rmtree(stale)
+            else:
+                os.remove(stale)
+        except OSError:
+            pass  # another process may still be mapping it
+
+
+def _carry_parts(folder, destination, scan):
+    """
+    Moves appended parts to a newer version of their source, minus the rows it
+    already has (same policy, node and date): a source regenerated with the
+    appended days in it must not count them twice
+    """
+    parts = _list_parts(folder)
+    if not parts:
+        return
+
+    frames = [pl.read_ipc(part, memory_map=False) for part in parts]
+    bounds = [_bounds(frame.lazy()) for frame in frames if not frame.is_empty()]
+    known = pl.DataFrame()
+    if bounds:
+        start, end = min(start for start, _ in bounds), max(end for _, end in bounds)
+        known = scan([(start, end)])\
+            .filter(pl.col("date").is_between(start, end))\
+            .select(KEYS)\
+            .unique()\
+            .collect()
+
+    os.makedirs(destination, exist_ok=True)
+    for part, frame in zip(parts, frames):
+        if not known.is_empty():
+            frame = frame.join(known.cast({key: frame.schema[key] for key in KEYS}), on=KEYS, how="anti")
+        if not frame.is_empty():
+            # parts are named by time and process, so they keep their order and never collide
+            target = os.path.join(destination, os.path.basename(part))
+            frame.write_ipc(f"{target}.tmp")
+            os.replace(f"{target}.tmp", target)
+        os.remove(part)
+
+
+def _load(source, key):
+    appends = appends_path(source, key)
+    stats = stats_path(source, key)
+
+    scanner = _scanner(source)
+    if scanner is not None:
+        # already columnar (or line-delimited): scan the source itself
+        if scanner is scan_partitions:
+            _prune(source, key, lambda intervals: _typed(scan_partitions(source, intervals)))
+        else:
+            _prune(source, key, lambda intervals: _typed(scanner(source)))
+        return Dataset(source, key, source, appends_dir=appends, stats_path=stats)
+
+    path = cache_path(source, key)
+    if os.path.exists(path) and not _casts(pl.read_ipc_schema(path)):
+        _prune(source, key, lambda intervals: pl.scan_ipc(path, memory_map=True))
+        return Dataset(source, key, path, appends_dir=appends, stats_path=stats)
+
+    # parsed once, then kept compact and sorted by date in the sidecar
+    rows = pl.read_json(source)
+    frame = _compact(rows)
+    _prune(source, key, lambda intervals: frame.lazy())
+    try:
+        _write_cache(frame, path)
+        _write_cache(rows, original_path(source, key))
+        _write_stats(_compute_stats(frame.lazy()), stats)
+    except OSError:
+        # read-only deployments skip the sidecar, and cannot persist appends either
+        return Dataset(source, key, None, frame)
+    return Dataset(source, key, path, frame, appends_dir=appends, stats_path=stats)
+
+
+def load(source=DEFAULT_SOURCE):
+    """
+    Returns the shared Dataset for a source, parsing it at most once per process
+
+    JSON sources are parsed once and written to an Arrow IPC sidecar keyed on the
+    source size and mtime, so later processes memory-map or scan it instead of
+    re-parsing. Parquet, Arrow IPC and NDJSON sources, and market folders of the
+    partitioned store, are scanned directly.
+    """
+    key = os.path.abspath(source)
+    current = fingerprint(source) # outside the lock: other sources need not wait on it
+    with _lock:
+        dataset = _datasets.get(key)
+        if dataset is None or dataset.fingerprint != current:
+            dataset = _load(source, current)
+            _datasets[key] = dataset
+        _datasets.move_to_end(key)
+
+    return dataset
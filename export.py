@@ -0,0 +1,90 @@
+import os
+import tempfile
+import zlib
+
+import flask
+import polars as pl
+
+
+CHUNK_BYTES = 1 << 20 # bytes sent per chunk of a spooled file
+CSV_BATCH_ROWS = 50_000 # rows written per chunk of a streamed CSV
+
+# dropdown value -> rows exported
+SELECTIONS = {
+    "window_data": lambda board: board.plan(in_window=True),
+    "exclusion_data": lambda board: board.plan(in_window=False),
+    "original_data": lambda board: board.dataset.original(),
+}
+
+# format -> (file extension, mimetype, lazy sink, eager writer)
+FORMATS = {
+    "csv": ("csv", "text/csv", "sink_csv", "write_csv"),
+    "parquet": ("parquet", "application/vnd.apache.parquet", "sink_parquet", "write_parquet"),
+    "arrow": ("arrow", "application/vnd.apache.arrow.file", "sink_ipc", "write_ipc"),
+}
+
+
+def response(board, selection, fmt="csv", gzip=False):
+    """
+    A streamed download of the selected rows of a Leaderboard
+
+    Rows are written chunk by chunk (CSV from memory) or spooled to a temporary file
+    by polars' streaming engine first (Parquet, Arrow IPC and lazy sources), so the
+    worker never holds the encoded file, let alone several copies of it.
+    """
+    if selection not in SELECTIONS:
+        flask.abort(400, f"unknown data selection {selection!r}")
+    if fmt not in FORMATS:
+        flask.abort(400, f"unknown export format {fmt!r}")
+
+    extension, mimetype, _, _ = FORMATS[fmt]
+    plan = SELECTIONS[selection](board)
+    if fmt == "csv" and not board.lazy:
+        chunks = _csv_chunks(plan.collect())
+    else:
+        chunks = _spooled_chunks(plan, fmt)
+
+    filename = f"trading_data.{extension}"
+    if gzip:
+        chunks = _gzipped(chunks)
+        filename += ".gz"
+        mimetype = "application/gzip"
+
+    return flask.Response(
+        flask.stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def _csv_chunks(frame):
+    # the in-memory frame sliced (zero-copy) and written one batch at a time
+    for offset in range(0, max(frame.height, 1), CSV_BATCH_ROWS):
+        yield frame.slice(offset, CSV_BATCH_ROWS).write_csv(include_header=offset == 0).encode()
+
+
+def _spooled_chunks(plan, fmt):
+    _, _, sink, writer = FORMATS[fmt]
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        try:
+            getattr(plan, sink)(path)
+        except (pl.ComputeError, pl.InvalidOperationError):
+            # plans the streaming engine cannot run are collected, then written
+            getattr(plan.collect(), writer)(path)
+
+        with open(path, "rb") as spooled:
+            while chunk := spooled.read(CHUNK_BYTES):
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) # gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
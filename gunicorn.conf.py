@@ -0,0 +1,28 @@
+import multiprocessing
+import os
+
+
+# Sizing: a worker process per core runs the CPU-heavy polars work in parallel,
+# and a few threads per worker keep slow callbacks from blocking fast ones.
+# Polars also parallelizes inside a query, so POLARS_MAX_THREADS caps its pool to
+# avoid cores * cores threads. Override with WEB_CONCURRENCY / GUNICORN_THREADS.
+cores = multiprocessing.cpu_count()
+
+bind = os.environ.get("GUNICORN_BIND", "127.0.0.1:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", cores))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = 120
+keepalive = 75 # longer than nginx keeps idle upstream connections
+preload_app = True # import the app once, then fork; the data is loaded after (see wsgi.py)
+
+os.environ.setdefault("POLARS_MAX_THREADS", str(max(1, cores // workers)))
+# sessions must be visible to every worker, so they live in a shared SQLite file
+os.environ.setdefault("LEADERBOARD_SESSIONS", "/tmp/leaderboard-sessions.db")
+
+
+def post_fork(server, worker):
+    # threads (polars' pool among them) do not survive fork: each worker loads the
+    # dataset in the background and runs its own feed watcher
+    from app import start_background
+    start_background()
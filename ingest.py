@@ -0,0 +1,144 @@
+import argparse
+import io
+
+import polars as pl
+
+import data
+
+
+# columns every record must carry; the others of data.SCHEMA are optional
+REQUIRED = [
+    "date", "policy", "node",
+    "profit_total", "profit_short", "profit_long",
+    "mwh_total",
+    "win_count_long", "win_count_short",
+]
+BATCH_BYTES = 64 << 20 # bytes of records parsed at a time
+
+
+def validate(frame):
+    """
+    Checks a batch of records has the required columns and casts it to data.SCHEMA
+
+    Raises ValueError on missing columns or on values that do not fit their type
+    """
+    missing = [column for column in REQUIRED if column not in frame.columns]
+    if missing:
+        raise ValueError(f"records are missing required columns: {', '.join(missing)}")
+
+    columns = []
+    for name, dtype in data.SCHEMA.items():
+        column = pl.col(name) if name in frame.columns else pl.lit(None)
+        if name == "date" and frame["date"].dtype == pl.Utf8:
+            column = column.str.to_date("%Y-%m-%d")
+        elif name == "date" and frame["date"].dtype == pl.Datetime:
+            column = column.dt.date()
+        columns.append(column.cast(dtype, strict=True).alias(name))
+
+    try:
+        frame = frame.select(columns)
+    except (pl.ComputeError, pl.InvalidOperationError) as error:
+        raise ValueError(f"records do not match the leaderboard schema: {error}") from error
+
+    nulls = [name for name in REQUIRED if frame[name].null_count()]
+    if nulls:
+        raise ValueError(f"records have empty values in: {', '.join(nulls)}")
+    return frame
+
+
+def read_batches(path, batch_bytes=BATCH_BYTES):
+    """
+    Yields validated frames of the records in blocks of about batch_bytes of a
+    newline-delimited JSON file, cut at line ends and parsed by polars, so only one
+    block is ever in memory
+    """
+    with open(path, "rb") as source:
+        pending = b""
+        while True:
+            block = source.read(batch_bytes)
+            if not block:
+                break
+            block = pending + block
+            end = block.rfind(b"\n") + 1
+            block, pending = block[:end], block[end:]
+            if block.strip():
+                yield validate(pl.read_ndjson(io.BytesIO(block)))
+        if pending.strip():
+            yield validate(pl.read_ndjson(io.BytesIO(pending)))
+
+
+def append_file(dataset, path, batch_bytes=BATCH_BYTES):
+    """
+    Appends the records of an NDJSON file to a dataset and its aggregates;
+    returns the number of rows added
+
+    Each batch is written as a staged part as soon as it is parsed; only once the
+    whole file is valid are the parts published and folded in at once, so a file
+    rejected midway adds nothing. Datasets without parts (read-only sidecars) fold
+    the batches in then.
+    """
+    rows = 0
+    staged, batches = [], []
+    try:
+        for batch in read_batches(path, batch_bytes):
+            part = dataset.stage_part(batch)
+            if part is None:
+                batches.append(batch)
+            else:
+                staged.append(part)
+            rows += batch.height
+    except BaseException:
+        dataset.discard_parts(staged)
+        raise
+
+    dataset.publish_parts(staged)
+    for batch in batches:
+        dataset.append(batch)
+    dataset.refresh()
+    return rows
+
+
+def store_file(market, path, batch_bytes=BATCH_BYTES, store=data.STORE_DIR):
+    """
+    Writes the records of an NDJSON file straight into the month files of a market
+    of the partitioned store (creating it); returns the number of rows written
+    """
+    rows = 0
+    for batch in read_batches(path, batch_bytes):
+        data.write_partitions(batch, market, store)
+        rows += batch.height
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Append NDJSON trade logs to a leaderboard dataset")
+    parser.add_argument("files", nargs="*", help="newline-delimited JSON files, one record per line")
+    parser.add_argument("--source", default=data.DEFAULT_SOURCE, help="dataset to append to")
+    parser.add_argument("--market", help="append to this market of the partitioned store instead (created if new)")
+    parser.add_argument("--compact", action="store_true", help="then fold the market's appended rows into its month files")
+    parser.add_argument("--batch-bytes", type=int, default=BATCH_BYTES, help="bytes of records parsed at a time")
+    args = parser.parse_args()
+
+    if args.market:
+        # rows are appended as parts, as for any source, so serving processes fold
+        # them in without a reload; --compact moves them into the month files
+        for path in args.files:
+            source = data.markets().get(args.market)
+            if source is None:
+                rows = store_file(args.market, path, args.batch_bytes)
+            else:
+                rows = append_file(data.load(source), path, args.batch_bytes)
+            print(f"{path}: {rows} rows added to market {args.market}")
+        if args.compact and args.market in data.markets():
+            rows = data.compact(data.markets()[args.market])
+            print(f"market {args.market}: {rows} appended rows compacted")
+        return
+
+    dataset = data.load(args.source)
+    for path in args.files:
+        rows = append_file(dataset, path, args.batch_bytes)
+        print(f"{path}: {rows} rows appended")
+
+
+if __name__ == "__main__":
+    main()
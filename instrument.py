@@ -0,0 +1,317 @@
+import functools
+import inspect
+import os
+import sys
+import threading
+import time
+
+from collections import Counter, defaultdict
+
+import flask
+import polars as pl
+
+import logic
+import sessions
+
+
+# request latency buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+HELPERS = ("chart_series", "chart_window", "rank_series", "wins_losses_data", "prepare_table_data") # app.py functions timed as stages
+PROFILE_DIR = os.path.join(".cache", "profiles")
+PLANNING = ("plan",) # stages that only build a LazyFrame: their callers read the rows
+
+_local = threading.local()
+
+
+class Request():
+    """
+    What one HTTP request spent its time on
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.route = None # the callback name, for callback requests
+        self.stages = defaultdict(float) # stage -> seconds
+        self.hits = 0
+        self.misses = 0
+        self.samples = Counter() # folded stack -> samples, when profiling
+
+    def server_timing(self, total=None):
+        """
+        The Server-Timing header: one entry per stage, the cache lookups and the total
+        (left out when unknown, as for streamed responses)
+        """
+        entries = [f"{_token(stage)};dur={seconds * 1000:.2f}" for stage, seconds in self.stages.items()]
+        if self.hits or self.misses:
+            entries.append(f'cache;desc="{self.hits} hits, {self.misses} misses"')
+        if total is not None:
+            entries.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(entries)
+
+
+class Metrics():
+    """
+    Counters of every instrumented stage and request, rendered in the Prometheus text format
+
+    Metrics are kept per process: behind several gunicorn workers each scrape sees
+    the worker that answered it.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage_seconds = defaultdict(float)
+        self.stage_calls = Counter()
+        self.stage_output_rows = Counter()
+        self.stage_scanned_rows = Counter()
+        self.lookups = Counter() # (query, "hit" | "miss") -> lookups
+        self.request_buckets = defaultdict(lambda: [0] * len(BUCKETS))
+        self.request_seconds = defaultdict(float)
+        self.request_count = Counter()
+        self.response_bytes = Counter()
+
+    def record_stage(self, stage, seconds, output_rows=None):
+        with self._lock:
+            self.stage_seconds[stage] += seconds
+            self.stage_calls[stage] += 1
+            if output_rows is not None:
+                self.stage_output_rows[stage] += output_rows
+
+    def record_scan(self, stage, rows):
+        with self._lock:
+            self.stage_scanned_rows[stage] += rows
+
+    def record_lookup(self, query, hit):
+        with self._lock:
+            self.lookups[(query, "hit" if hit else "miss")] += 1
+
+    def record_request(self, route, seconds, size):
+        with self._lock:
+            buckets = self.request_buckets[route]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+            self.request_seconds[route] += seconds
+            self.request_count[route] += 1
+            if size is not None:
+                self.response_bytes[route] += size
+
+    def render(self):
+        with self._lock:
+            lines = []
+            _family(lines, "leaderboard_stage_seconds", "summary", "Time spent in each instrumented stage")
+            for stage in sorted(self.stage_calls):
+                lines.append(f'leaderboard_stage_seconds_sum{{stage="{stage}"}} {self.stage_seconds[stage]:.6f}')
+                lines.append(f'leaderboard_stage_seconds_count{{stage="{stage}"}} {self.stage_calls[stage]}')
+
+            _family(lines, "leaderboard_stage_output_rows_total", "counter", "Rows of the frames returned by each stage (not the rows it read)")
+            for stage in sorted(self.stage_output_rows):
+                lines.append(f'leaderboard_stage_output_rows_total{{stage="{stage}"}} {self.stage_output_rows[stage]}')
+
+            _family(lines, "leaderboard_stage_scanned_rows_total", "counter", "Rows of the data each stage read, directly or through the cube")
+            for stage in sorted(self.stage_scanned_rows):
+                lines.append(f'leaderboard_stage_scanned_rows_total{{stage="{stage}"}} {self.stage_scanned_rows[stage]}')
+
+            _family(lines, "leaderboard_query_cache_lookups_total", "counter", "Query cache lookups by query and result")
+            for (query, result), count in sorted(self.lookups.items()):
+                lines.append(f'leaderboard_query_cache_lookups_total{{query="{query}",result="{result}"}} {count}')
+
+            stats = logic.query_cache.stats()
+            _family(lines, "leaderboard_query_cache_entries", "gauge", "Results held by the query cache")
+            lines.append(f"leaderboard_query_cache_entries {stats['size']}")
+
+            _family(lines, "leaderboard_request_seconds", "histogram", "Request latency by route (callback name or URL rule)")
+            for route in sorted(self.request_count):
+                for bound, count in zip(BUCKETS, self.request_buckets[route]):
+                    lines.append(f'leaderboard_request_seconds_bucket{{route="{route}",le="{bound}"}} {count}')
+                lines.append(f'leaderboard_request_seconds_bucket{{route="{route}",le="+Inf"}} {self.request_count[route]}')
+                lines.append(f'leaderboard_request_seconds_sum{{route="{route}"}} {self.request_seconds[route]:.6f}')
+                lines.append(f'leaderboard_request_seconds_count{{route="{route}"}} {self.request_count[route]}')
+
+            _family(lines, "leaderboard_response_bytes_total", "counter", "Response body bytes by route")
+            for route in sorted(self.response_bytes):
+                lines.append(f'leaderboard_response_bytes_total{{route="{route}"}} {self.response_bytes[route]}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def _family(lines, name, kind, help_text):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def _token(stage):
+    # Server-Timing names are HTTP tokens: no spaces, brackets or quotes
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in stage)
+
+
+def timed(stage, function):
+    """
+    Wraps a function so each call is recorded as a stage, globally and on the current
+    request; when it returns a polars DataFrame its rows are counted as the stage's output
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        # the stages in progress on this thread, innermost last, for _observe_scan
+        in_progress = _local.__dict__.setdefault("in_progress", [])
+        in_progress.append(stage)
+        start = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            in_progress.pop()
+        elapsed = time.perf_counter() - start
+        metrics.record_stage(stage, elapsed, result.height if isinstance(result, pl.DataFrame) else None)
+        request = getattr(_local, "request", None)
+        if request is not None:
+            request.stages[stage] += elapsed
+        return result
+    return wrapper
+
+
+def _observe_lookup(query, hit):
+    metrics.record_lookup(query, hit)
+    request = getattr(_local, "request", None)
+    if request is not None:
+        if hit:
+            request.hits += 1
+        else:
+            request.misses += 1
+
+
+def _observe_scan(rows):
+    # rows read count for the innermost stage in progress that collects its query
+    readers = [stage for stage in getattr(_local, "in_progress", ()) if stage not in PLANNING]
+    metrics.record_scan(readers[-1] if readers else "unstaged", rows)
+
+
+class Sampler(threading.Thread):
+    """
+    Sampling profiler of the threads serving a request
+
+    Every `interval` seconds it records the Python stack of each request in flight;
+    requests slower than `threshold` seconds get their samples written to `folder`
+    as folded stacks (the input of flamegraph.pl and speedscope).
+    """
+    def __init__(self, threshold, folder=PROFILE_DIR, interval=0.005):
+        super().__init__(name="request-sampler", daemon=True)
+        self.threshold = threshold
+        self.folder = folder
+        self.interval = interval
+        self.pid = os.getpid()
+        self._requests = {} # thread id -> Request
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            for thread_id, request in list(self._requests.items()):
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    request.samples[_fold(frame)] += 1
+
+    def watch(self, request):
+        self._requests[threading.get_ident()] = request
+
+    def release(self, request, elapsed):
+        self._requests.pop(threading.get_ident(), None)
+        if elapsed < self.threshold or not request.samples:
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{_token(request.route or 'request')}-{elapsed * 1000:.0f}ms.folded"
+        with open(os.path.join(self.folder, name), "w") as output:
+            for stack, count in request.samples.most_common():
+                output.write(f"{stack} {count}\n")
+
+
+def _fold(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+def install(app, helpers, slow_ms=None, profile_dir=PROFILE_DIR):
+    """
+    Instruments a Dash app: every callback, every public Leaderboard method, the
+    session store, the JSON serialization of responses and the `helpers` functions
+    found in the given namespace (app.py's globals) become timed stages
+
+    Adds a /metrics endpoint and a Server-Timing header on every response. With
+    slow_ms, requests slower than that many milliseconds are profiled to profile_dir.
+    """
+    import dash._callback
+
+    for name, member in list(vars(logic.Leaderboard).items()):
+        if inspect.isfunction(member) and not name.startswith("_"):
+            setattr(logic.Leaderboard, name, timed(name, member))
+    for name in ("load", "save"):
+        setattr(sessions.SessionStore, name, timed(f"session_{name}", getattr(sessions.SessionStore, name)))
+    for name in HELPERS:
+        if name in helpers:
+            helpers[name] = timed(name, helpers[name])
+    dash._callback.to_json = timed("serialize", dash._callback.to_json)
+    logic.query_cache.observer = _observe_lookup
+    logic.scan_observer = _observe_scan
+
+    for callback in app.callback_map.values():
+        if "callback" in callback: # clientside callbacks run in the browser
+            callback["callback"] = _callback_stage(callback["callback"])
+
+    sampler = None
+
+    def current_sampler():
+        nonlocal sampler
+        if sampler is None or sampler.pid != os.getpid():
+            # threads do not survive a fork: each worker starts its own
+            sampler = Sampler(slow_ms / 1000, profile_dir)
+            sampler.start()
+        return sampler
+
+    server = app.server
+
+    @server.before_request
+    def start_request():
+        _local.request = Request()
+        if slow_ms is not None:
+            current_sampler().watch(_local.request)
+
+    @server.after_request
+    def finish_request(response):
+        request = getattr(_local, "request", None)
+        if request is None:
+            return response
+        _local.request = None
+
+        elapsed = time.perf_counter() - request.started
+        route = request.route or (flask.request.url_rule.rule if flask.request.url_rule else "unmatched")
+        if response.is_streamed:
+            # the body is produced after this returns: elapsed only measures the time
+            # to the headers, so it goes neither in the histogram nor in the total
+            response.headers["Server-Timing"] = request.server_timing()
+        else:
+            metrics.record_request(route, elapsed, response.calculate_content_length())
+            response.headers["Server-Timing"] = request.server_timing(elapsed)
+        if slow_ms is not None:
+            request.route = route
+            current_sampler().release(request, elapsed)
+        return response
+
+    @server.route("/metrics")
+    def prometheus_metrics():
+        return flask.Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+def _callback_stage(callback):
+    # times a registered callback, serialization included, under its own name
+    name = callback.__name__
+    timed_callback = timed(f"callback.{name}", callback)
+
+    @functools.wraps(callback)
+    def wrapper(*args, **kwargs):
+        request = getattr(_local, "request", None)
+        if request is not None:
+            request.route = name
+        return timed_callback(*args, **kwargs)
+    return wrapper
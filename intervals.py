@@ -0,0 +1,114 @@
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+import polars as pl
+
+
+ONE_DAY = timedelta(days=1)
+
+
+class IntervalSet():
+    """
+    Immutable, sorted set of disjoint inclusive date intervals
+
+    Overlapping or touching intervals are merged on insertion, so the set is always
+    minimal. Being immutable, a set can be kept as-is for undo/redo and used as a key.
+    """
+    def __init__(self, intervals=()):
+        self._starts = ()
+        self._ends = ()
+        for start, end in intervals:
+            merged = self.add(start, end)
+            self._starts, self._ends = merged._starts, merged._ends
+
+    @classmethod
+    def _from_bounds(cls, starts, ends):
+        new = cls.__new__(cls)
+        new._starts = tuple(starts)
+        new._ends = tuple(ends)
+        return new
+
+    def __iter__(self):
+        return iter(zip(self._starts, self._ends))
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __eq__(self, other):
+        return isinstance(other, IntervalSet) and self._starts == other._starts and self._ends == other._ends
+
+    def __hash__(self):
+        return hash((self._starts, self._ends))
+
+    def __repr__(self):
+        return f"IntervalSet({list(self)})"
+
+    def add(self, start, end):
+        """
+        Returns a new set that also covers [start, end]
+        """
+        if end < start:
+            start, end = end, start
+
+        # first interval whose end touches start, last interval whose start touches end
+        lo = bisect_left(self._ends, start - ONE_DAY)
+        hi = bisect_right(self._starts, end + ONE_DAY)
+        if lo < hi:
+            start = min(start, self._starts[lo])
+            end = max(end, self._ends[hi - 1])
+
+        return IntervalSet._from_bounds(
+            self._starts[:lo] + (start,) + self._starts[hi:],
+            self._ends[:lo] + (end,) + self._ends[hi:],
+        )
+
+    def remove(self, start, end):
+        """
+        Returns a new set that no longer covers [start, end], splitting intervals if needed
+        """
+        if end < start:
+            start, end = end, start
+
+        lo = bisect_left(self._ends, start)
+        hi = bisect_right(self._starts, end)
+        if lo >= hi:
+            return self
+
+        starts, ends = [], []
+        if self._starts[lo] < start:
+            starts.append(self._starts[lo])
+            ends.append(start - ONE_DAY)
+        if self._ends[hi - 1] > end:
+            starts.append(end + ONE_DAY)
+            ends.append(self._ends[hi - 1])
+
+        return IntervalSet._from_bounds(
+            self._starts[:lo] + tuple(starts) + self._starts[hi:],
+            self._ends[:lo] + tuple(ends) + self._ends[hi:],
+        )
+
+    def gaps(self, start, end):
+        """
+        The parts of [start, end] not covered by the set, as a list of intervals
+        """
+        gaps = []
+        lo = bisect_left(self._ends, start)
+        hi = bisect_right(self._starts, end)
+        for covered_start, covered_end in zip(self._starts[lo:hi], self._ends[lo:hi]):
+            if covered_start > start:
+                gaps.append((start, covered_start - ONE_DAY))
+            start = covered_end + ONE_DAY
+        if start <= end:
+            gaps.append((start, end))
+        return gaps
+
+
+def within(intervals, column="date"):
+    """
+    A polars expression that is True for rows inside any of the given intervals
+
+    Positive ranges let scans skip row groups whose dates fall outside all of them
+    """
+    if not intervals:
+        return pl.lit(False)
+    return pl.any_horizontal([pl.col(column).is_between(start, end) for start, end in intervals])
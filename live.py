@@ -0,0 +1,110 @@
+import logging
+import os
+import threading
+
+from datetime import datetime
+
+import polars as pl
+
+import ingest
+import logic
+from cube import sums
+
+
+FEED_EXTENSIONS = (".ndjson", ".jsonl")
+INGESTED = "ingested" # claimed feed files are moved here
+REJECTED = "rejected" # files that failed validation end up here
+
+logger = logging.getLogger(__name__)
+
+
+class FeedWatcher(threading.Thread):
+    """
+    Background thread folding new trading days into a dataset
+
+    Every `interval` seconds it claims the NDJSON files dropped in `folder` (by
+    moving them to folder/ingested, so only one worker process ingests each file),
+    appends them, and picks up the parts other workers appended meanwhile.
+    """
+    def __init__(self, dataset, folder, interval=5.0):
+        super().__init__(name="feed-watcher", daemon=True)
+        self.dataset = dataset
+        self.folder = folder
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("feed poll failed")
+
+    def stop(self):
+        self._stopped.set()
+
+    def poll(self):
+        """
+        One pass over the feed; returns the number of rows added to the dataset
+        """
+        for subfolder in (INGESTED, REJECTED):
+            os.makedirs(os.path.join(self.folder, subfolder), exist_ok=True)
+
+        rows = 0
+        for entry in sorted(os.listdir(self.folder)):
+            if not entry.endswith(FEED_EXTENSIONS):
+                continue
+            claimed = os.path.join(self.folder, INGESTED, entry)
+            try:
+                os.rename(os.path.join(self.folder, entry), claimed)
+            except FileNotFoundError:
+                continue # another worker claimed it first
+
+            try:
+                rows += ingest.append_file(self.dataset, claimed)
+            except ValueError:
+                logger.exception("rejected feed file %s", entry)
+                os.rename(claimed, os.path.join(self.folder, REJECTED, entry))
+
+        return rows + self.dataset.refresh()
+
+
+def start(dataset, folder, interval=5.0):
+    """
+    Starts a FeedWatcher on the folder; call it in every process serving the app
+    """
+    watcher = FeedWatcher(dataset, folder, interval)
+    watcher.start()
+    return watcher
+
+
+def new_days(board, tails):
+    """
+    The daily profit sums (as Leaderboard.daily_profits) the chart does not have yet
+
+    `tails` lists the last date the page holds for each policy ({"name", "x"}). Days
+    after it are new; policies the page has no series for are sent whole.
+    """
+    last_seen = {tail["name"]: _to_date(tail["x"]) for tail in tails or []}
+    seen = pl.DataFrame(
+        {"policy": list(last_seen), "last_date": list(last_seen.values())},
+        schema={"policy": pl.Categorical, "last_date": pl.Date},
+    )
+
+    plan = board.plan(in_window=False, columns=["policy", "date", *logic.PROFITS])
+    if last_seen:
+        plan = plan.filter(
+            (pl.col("date") > min(last_seen.values())) | ~pl.col("policy").is_in(list(last_seen))
+        )
+
+    return plan.collect()\
+        .join(seen, on="policy", how="left")\
+        .filter(pl.col("last_date").is_null() | (pl.col("date") > pl.col("last_date")))\
+        .group_by(["policy", "date"])\
+        .agg(sums(logic.PROFITS))\
+        .sort(["policy", "date"])
+
+
+def _to_date(value):
+    # plotly reports dates as "YYYY-MM-DD", optionally followed by a time
+    return datetime.fromisoformat(str(value).replace(" ", "T")[:19]).date()
@@ -1,72 +1,362 @@
+import functools
+import os
+import threading
+
 import polars as pl
 
-from datetime import datetime
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+import data
+import metrics
+from cube import MEASURES, sums
+from intervals import IntervalSet, within
+
+
+HISTORY = 20 # undo steps kept for the excluded regions
+SCENARIO_KEYS = ["window", "area_only", "excluded", "grouping", "topn", "metric"] # state a scenario can override
+PROFITS = ["profit_total", "profit_short", "profit_long"] # the columns the profit chart can show
+OUTCOMES = ["win_count_long", "win_count_short", "loss_count_long", "loss_count_short"] # the Wins vs Losses tab
+HISTOGRAM_BINS = 40 # bins of the daily PnL distribution
+
+
+class QueryCache():
+    """
+    Bounded LRU of query results, shared by every Leaderboard in the process
+
+    Results are immutable polars frames, so sessions in the same state share them.
+    `observer`, if set, is called on every lookup with the first item of the key (the
+    query name) and whether it was a hit.
+    """
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.observer = None
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            hit = key in self._results
+            if hit:
+                self.hits += 1
+                self._results.move_to_end(key)
+                result = self._results[key]
+            else:
+                self.misses += 1
+        if self.observer is not None:
+            self.observer(key[0], hit)
+        if hit:
+            return result
+
+        result = compute()
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._results), "maxsize": self.maxsize}
+
+
+query_cache = QueryCache()
+
+# called with the number of rows each query reads, if set (see instrument.py)
+scan_observer = None
+
+
+def memoized(*fields):
+    """
+    Caches a Leaderboard query in query_cache, keyed on the dataset version and the
+    given state fields (attribute names, or "coverage" for the rows in focus)
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self):
+            key = (method.__name__, self.dataset.source, self.dataset.version, self.state_key(fields))
+            return query_cache.get_or_compute(key, lambda: method(self))
+        return wrapper
+    return decorator
 
 
 class Leaderboard():
-    def __init__(self):
-        self.original = pl.read_json("leaderboard_example.json")
-        self.window = pl.read_json("leaderboard_example.json")
-        self.exclusions_df = pl.read_json("leaderboard_example.json")
+    def __init__(self, source=data.DEFAULT_SOURCE, lazy=False):
+        # the dataset is parsed once per process and shared by every instance;
+        # polars frames are immutable so no instance can alter it for the others
+        self.dataset = data.load(source)
+        self.lazy = lazy # query scans of the source instead of the in-memory frame
+        self.exclusions = IntervalSet() # excluded regions, merged and sorted
+        self._undo = [] # previous exclusion sets, most recent last
+        self._redo = []
 
         self.metric = "PnL"
         self.area_only = False
         self.grouping = True
         self.topn = None # group all nodes
+        self.risk = False # risk metric columns in the summary (always with a risk metric)
         self.chart_type = "profit_total"
-        self.window_start = datetime(2022, 9, 16)
-        self.window_end = datetime(2024, 10, 15)
+        self.window_start, self.window_end = self.get_date_range() # the whole history
+
+    def get_state(self):
+        """
+        The parameters that fully describe this leaderboard, as plain JSON types
+
+        The dataframes are not part of the state: they are rebuilt from the shared dataset
+        """
+        return {
+            "source": self.dataset.source,
+            "lazy": self.lazy,
+            "window": [self.window_start.isoformat(), self.window_end.isoformat()],
+            "excluded": _dump_intervals(self.exclusions),
+            "undo": [_dump_intervals(previous) for previous in self._undo],
+            "redo": [_dump_intervals(following) for following in self._redo],
+            "metric": self.metric,
+            "area_only": self.area_only,
+            "grouping": self.grouping,
+            "topn": self.topn,
+            "risk": self.risk,
+            "chart_type": self.chart_type,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        Rebuilds a leaderboard from the output of get_state
+        """
+        board = cls(state["source"], lazy=state.get("lazy", False))
+        board.metric = metrics.validate(state["metric"])
+        board.area_only = state["area_only"]
+        board.grouping = state["grouping"]
+        board.topn = state["topn"]
+        board.risk = state.get("risk", False)
+        board.chart_type = state["chart_type"]
+
+        board.exclusions = _load_intervals(state["excluded"])
+        board._undo = [_load_intervals(previous) for previous in state.get("undo", [])]
+        board._redo = [_load_intervals(following) for following in state.get("redo", [])]
+        board.zoom_in(*(_to_date(bound) for bound in state["window"]))
+
+        return board
+
+    def state_key(self, fields):
+        """
+        Canonical, hashable values of the given state fields
+
+        "coverage" stands for the rows in focus: the exclusions, plus the window only
+        when it applies, so the window position does not split the cache otherwise
+        """
+        key = []
+        for field in fields:
+            if field == "coverage":
+                window = (self.window_start, self.window_end) if self.area_only else None
+                key.append((self.exclusions, window))
+            else:
+                key.append(getattr(self, field))
+        return tuple(key)
 
     def get_date_range(self):
-        # Check if the 'date' column is already a date type, if so, use it directly
-        
-        date_column = self.original["date"]
-        dates = date_column.to_list()
-        return min(dates), max(dates)  # Return min and max dates as a tuple
+        return self.dataset.date_range()  # Return min and max dates as a tuple
+
+    def _source(self, intervals):
+        if self.lazy:
+            # partitioned sources only scan the partitions of the intervals
+            self._scanned(intervals)
+            return self.dataset.scan(intervals).filter(within(intervals))
+        # the in-memory frame is sorted by date: slice the intervals out of it
+        rows = self.dataset.rows_within(intervals)
+        self._scanned(intervals, rows.height)
+        return rows.lazy()
 
-    
-    def which_df(self):
+    def _scanned(self, intervals, rows=None):
         """
-        Depending on the state of the app, we focus on one dataframe or the other
+        Reports the rows a query reads to scan_observer, if set: `rows`, or else the
+        rows of the intervals as counted by the cube (unknown before it is built)
         """
-        if self.area_only:
-            df = self.window
-        else:
-            df = self.exclusions_df
+        if scan_observer is None:
+            return
+        if rows is None:
+            rows = self.dataset.row_count(intervals)
+        if rows is not None:
+            scan_observer(rows)
 
-        return df
+    def plan(self, in_window=None, columns=None):
+        """
+        The rows in focus as a LazyFrame: the window when in_window (by default, in
+        area mode), the exclusions dataframe otherwise
+
+        Nothing is read until the plan is collected. In lazy mode the date filter and
+        the column selection are pushed down into the scan of the source, so only the
+        active date range of the needed columns is read.
+        """
+        lf = self._source(self.active_intervals(in_window))
+        if columns is not None:
+            lf = lf.select(columns)
+        return lf
+
+    @memoized("exclusions")
+    def daily_profits(self):
+        """
+        Per (policy, date) sums of every profit column the chart can show, over the
+        whole history minus the excluded regions, sorted by policy and date
 
+        The browser cumulates and clips these itself, so switching the chart type or
+        the area mode does not need the server
+        """
+        return self.plan(in_window=False, columns=["policy", "date", *PROFITS])\
+            .group_by(["policy", "date"])\
+            .agg(sums(PROFITS))\
+            .sort(["policy", "date"])\
+            .collect()
+
+    def active_intervals(self, in_window=None):
+        """
+        The date intervals covered by the dataframe in focus: the window (or the whole
+        history) minus the excluded regions
+        """
+        if in_window is None:
+            in_window = self.area_only
+
+        start, end = self.get_date_range()
+        if in_window:
+            start, end = max(self.window_start, start), min(self.window_end, end)
+
+        return self.exclusions.gaps(start, end)
+
+    @memoized("coverage")
+    def node_totals(self):
+        """
+        Per (policy, node) totals of the dataframe in focus
+
+        Read off the daily cube, or aggregated by a lazy scan in lazy mode
+        """
+        if self.lazy:
+            return self.plan(columns=["policy", "node", *MEASURES])\
+                .group_by(["policy", "node"])\
+                .agg(sums(MEASURES))\
+                .collect()
+
+        intervals = self.active_intervals()
+        self._scanned(intervals)
+        return self.dataset.cube.totals(intervals)
+
+    @memoized("coverage")
+    def node_days(self):
+        """
+        Per (policy, node, date) totals of the dataframe in focus, the daily series the
+        risk metrics are computed from
+
+        Read off the daily cube, or aggregated by a lazy scan in lazy mode
+        """
+        if self.lazy:
+            return self.plan(columns=["policy", "node", "date", *MEASURES])\
+                .group_by(["policy", "node", "date"])\
+                .agg(sums(MEASURES))\
+                .collect()
+
+        intervals = self.active_intervals()
+        self._scanned(intervals)
+        return self.dataset.cube.daily(intervals)
+
+    @memoized("coverage")
+    def node_metrics(self):
+        """
+        Every registry metric per (policy, node) of the dataframe in focus
+        """
+        return metrics.table(self.node_totals(), self.node_days(), ["policy", "node"])
+
+    @memoized("coverage", "grouping", "topn", "metric", "risk")
     def summarize(self):
         """
-        Produces a summary leaderboard of the dataframe in focus
+        Produces a summary leaderboard of the dataframe in focus, with every metric of
+        the registry, sorted on the current one
+
+        The risk metrics need the daily series, so they are only computed when shown
+        or ranked on (null otherwise); the other metrics come off the cube's totals
         """
-        df = self.which_df()
+        totals = self.node_totals()
+        days = self.node_days() if self.risk or metrics.from_days(self.metric) else None
 
         if self.grouping and self.topn is not None:
-            # TODO: maybe we want to save these for the user to know which are
-            #       the nodes included in the top for each policy
             topn = self.filter_topn()
-            df = df.join(topn, on=["policy", "node"], how="inner") # always on policy AND node
-
-        grouping_feats = self.which_grouping()
-        summary = df.group_by(grouping_feats).agg(pl.col("*").sum())\
-            .with_columns(
-                (pl.col("profit_total")/pl.col("mwh_total")).alias("per MWh"),
-                (pl.col("win_count_long")+pl.col("win_count_short")).alias("win_count"),
-            )\
-            .with_columns(
-                (100*pl.col("win_count")/pl.col("mwh_total")).alias("win %")
-            )\
-            .select(
-                *grouping_feats, # all the grouping variables should display
-                pl.col("profit_total").alias("PnL"),
-                "per MWh",
-                "win %"
-            )\
-            .sort(by=self.metric, descending=True)
+            totals = totals.join(topn, on=["policy", "node"], how="semi") # always on policy AND node
+            if days is not None:
+                days = days.join(topn, on=["policy", "node"], how="semi")
+
+        summary = metrics.table(totals, days, self.which_grouping())\
+            .sort(by=self.metric, descending=metrics.descending(self.metric), nulls_last=True)
 
         return summary
 
+    @memoized("coverage", "grouping", "topn", "metric")
+    def rank_history(self):
+        """
+        The rank of every row of the summary on each day of the dataframe in focus,
+        under the current metric computed over the days up to that one
+
+        With top-N nodes, the nodes are those of the current table throughout
+        """
+        days = self.node_days()
+        if self.grouping and self.topn is not None:
+            days = days.join(self.filter_topn(), on=["policy", "node"], how="semi")
+
+        return metrics.replay(days, self.which_grouping(), self.metric)
+
+    @memoized("coverage", "grouping", "topn")
+    def daily_outcomes(self):
+        """
+        Per (policy, date) PnL and win and loss counts of the rows in the table (the
+        top N nodes, if any), in one group-by over the dataframe in focus
+        """
+        lf = self.plan(columns=["policy", "node", "date", "profit_total", *OUTCOMES])
+        if self.grouping and self.topn is not None:
+            lf = lf.join(self.filter_topn().lazy(), on=["policy", "node"], how="semi")
+
+        return lf.group_by(["policy", "date"])\
+            .agg(*sums(["profit_total"]), pl.col(OUTCOMES).cast(pl.Int64).sum())\
+            .sort(["policy", "date"])\
+            .collect()
+
+    @memoized("coverage", "grouping", "topn")
+    def outcome_counts(self):
+        """
+        Total win and loss counts, long and short, per policy
+        """
+        return self.daily_outcomes()\
+            .group_by("policy")\
+            .agg(pl.col(OUTCOMES).sum())\
+            .sort("policy")
+
+    @memoized("coverage", "grouping", "topn")
+    def pnl_histogram(self):
+        """
+        The number of days per policy in each of HISTOGRAM_BINS equal bins of daily PnL
+
+        The bins are shared by every policy so they line up, and span the 1st to 99th
+        percentile of the daily PnL; the outer bins also hold the days beyond
+        """
+        daily = self.daily_outcomes()
+        if daily.is_empty():
+            return pl.DataFrame(schema={"policy": daily.schema["policy"], "start": pl.Float64, "end": pl.Float64, "days": pl.UInt32})
+
+        low, high = daily["profit_total"].quantile(0.01), daily["profit_total"].quantile(0.99)
+        width = (high - low) / HISTOGRAM_BINS or 1.0
+        bucket = ((pl.col("profit_total") - low) / width).floor().clip(0, HISTOGRAM_BINS - 1).cast(pl.Int32)
+        return daily.group_by("policy", bucket.alias("bin"))\
+            .agg(pl.len().alias("days"))\
+            .sort(["policy", "bin"])\
+            .select(
+                "policy",
+                (low + pl.col("bin") * width).alias("start"),
+                (low + (pl.col("bin") + 1) * width).alias("end"),
+                "days",
+            )
+
     def which_grouping(self):
         # keep policies separate always; node separation is optional (user input)
         grouping = ["policy"]
@@ -75,30 +365,117 @@ class Leaderboard():
 
         return grouping
 
-    def filter_topn(self):
-        df = self.which_df()
-
-        grouping_feats = ["policy", "node"] # the topn filter is always on policy AND node
-        topn = df.group_by(grouping_feats).agg(pl.col("*").sum())\
-            .with_columns(
-                (pl.col("profit_total")/pl.col("mwh_total")).alias("per MWh"),
-                (pl.col("win_count_long")+pl.col("win_count_short")).alias("win_count"),
-            )\
-            .with_columns(
-                (100*pl.col("win_count")/pl.col("mwh_total")).alias("win %")
-            )\
+    @memoized("coverage", "metric")
+    def node_ranking(self):
+        """
+        The rank of every node within its policy under the current metric, 1 being the
+        best; nodes without a value for the metric rank last
+
+        Ranked once per window and metric, so changing N only re-slices it. PnL, per
+        MWh and win % come straight from the node totals; only the risk metrics need
+        the daily series.
+        """
+        descending = metrics.descending(self.metric)
+        worst = float("-inf") if descending else float("inf")
+        if metrics.from_days(self.metric):
+            values = self.node_metrics()
+        else:
+            values = metrics.totals(self.node_totals(), ["policy", "node"])
+        return values\
             .select(
-                *grouping_feats,
-                pl.col("profit_total").alias("PnL"),
-                "per MWh",
-                "win %"
-            )\
-            .sort(by=self.metric, descending=True)\
-            .group_by("policy")\
-            .head(self.topn)\
+                "policy",
+                "node",
+                pl.col(self.metric).fill_nan(worst).fill_null(worst)
+                    .rank("ordinal", descending=descending).over("policy")
+                    .alias("rank"),
+            )
+
+    @memoized("coverage", "topn", "metric")
+    def filter_topn(self):
+        """
+        The (policy, node) pairs of the top nodes of each policy under the current metric
+        """
+        return self.node_ranking()\
+            .filter(pl.col("rank") <= self.topn)\
             .select(["policy", "node"]) # unclear whether this should always equal grouping
 
-        return topn
+    def top_nodes(self):
+        """
+        The nodes summarize keeps for each policy, best first, as {policy: [node, ...]};
+        None when every node is included
+        """
+        if not self.grouping or self.topn is None:
+            return None
+
+        ranking = self.node_ranking()\
+            .filter(pl.col("rank") <= self.topn)\
+            .sort(["policy", "rank"])\
+            .group_by("policy", maintain_order=True)\
+            .agg("node")
+        return dict(ranking.iter_rows())
+
+    def evaluate_scenarios(self, scenarios, max_workers=None):
+        """
+        Summarizes many variations of this leaderboard at once and stacks the summaries
+
+        Each scenario is a dict with a "name" and any of SCENARIO_KEYS, in the form of
+        get_state (dates may be date objects), overriding this leaderboard's state; a
+        "window" also turns the area mode on. Scenarios run in a thread pool over the
+        shared, read-only dataset (polars releases the GIL) and share the query cache.
+
+        Returns one frame: "scenario" and "rank" (1 is the top of that scenario's
+        table), then the summary columns; "node" is null for grouped scenarios
+        """
+        boards = [(scenario["name"], self._scenario_board(scenario)) for scenario in scenarios]
+        if not boards:
+            return pl.DataFrame()
+        if not self.lazy:
+            self.dataset.cube # built once, before the threads query it
+
+        from concurrent.futures import ThreadPoolExecutor # only what-if comparisons need it
+
+        workers = max_workers or min(len(boards), os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scenario") as pool:
+            summaries = list(pool.map(lambda board: board.summarize(), [board for _, board in boards]))
+
+        stacked = pl.concat(
+            [
+                summary.with_row_index("rank", offset=1).with_columns(pl.lit(name).alias("scenario"))
+                for (name, _), summary in zip(boards, summaries)
+            ],
+            how="diagonal",
+        )
+        keys = [key for key in ("policy", "node") if key in stacked.columns]
+        return stacked.select("scenario", "rank", *keys, *metrics.METRICS)
+
+    def monthly_scenarios(self, year):
+        """
+        One scenario per month of the year that has data, excluding that month on top
+        of the current exclusions
+        """
+        first, last = self.get_date_range()
+        scenarios = []
+        for month in range(1, 13):
+            start = date(year, month, 1)
+            end = (date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)) - timedelta(days=1)
+            if end < first or start > last:
+                continue
+            scenarios.append({
+                "name": f"without {start:%Y-%m}",
+                "excluded": _dump_intervals(self.exclusions.add(start, end)),
+            })
+        return scenarios
+
+    def _scenario_board(self, scenario):
+        state = {**self.get_state(), "undo": [], "redo": []}
+        for key in SCENARIO_KEYS:
+            if key in scenario:
+                state[key] = scenario[key]
+        if "window" in scenario:
+            state["window"] = [_iso(bound) for bound in scenario["window"]]
+            state["area_only"] = scenario.get("area_only", True)
+        state["excluded"] = [[_iso(start), _iso(end)] for start, end in state["excluded"]]
+        return Leaderboard.from_state(state)
 
     def exclude_region(self, start_date, end_date):
         """
@@ -106,12 +483,54 @@ class Leaderboard():
 
         Event: selection (i.e. exclusion), on mouse release
         """
-        self.exclusions_df = self.exclusions_df.filter(
-            ~pl.col("date").is_between(start_date, end_date)
-        )
-        self.window = self.exclusions_df.filter(
-            pl.col("date").is_between(self.window_start, self.window_end)
-        )
+        self._set_exclusions(self.exclusions.add(start_date, end_date))
+
+    def include_region(self, start_date, end_date):
+        """
+        Brings back a previously excluded region, or part of one
+
+        Event: button, on click
+        """
+        self._set_exclusions(self.exclusions.remove(start_date, end_date))
+
+    def reset_exclusions(self):
+        """
+        Drops every excluded region, keeping the current window
+
+        Event: button, on click
+        """
+        self._set_exclusions(IntervalSet())
+
+    def undo_exclusion(self):
+        """
+        Reverts the last change to the excluded regions; returns False if there was none
+
+        Event: button, on click
+        """
+        if not self._undo:
+            return False
+        self._redo.append(self.exclusions)
+        self.exclusions = self._undo.pop()
+        return True
+
+    def redo_exclusion(self):
+        """
+        Re-applies the last undone change to the excluded regions; returns False if there was none
+
+        Event: button, on click
+        """
+        if not self._redo:
+            return False
+        self._undo.append(self.exclusions)
+        self.exclusions = self._redo.pop()
+        return True
+
+    def _set_exclusions(self, exclusions):
+        if exclusions == self.exclusions:
+            return
+        self._undo = (self._undo + [self.exclusions])[-HISTORY:]
+        self._redo = []
+        self.exclusions = exclusions
 
     def zoom_in(self, start_date, end_date):
         """
@@ -121,8 +540,6 @@ class Leaderboard():
         """
         self.window_start = start_date
         self.window_end = end_date
-        self.window = self.exclusions_df.filter(
-            pl.col("date").is_between(self.window_start, self.window_end))
 
     def pan(self, start_date, end_date):
         """
@@ -156,13 +573,37 @@ class Leaderboard():
         """
         self.topn = n
 
+    def show_risk(self, shown):
+        """
+        Shows or hides the risk metric columns of the summary
+
+        Event: checklist, on change
+        """
+        self.risk = bool(shown)
+
     def set_metric(self, new_metric):
         """
         Changes the value of the metric to sort-by
 
-        Valid metrics are 'PnL', 'Per MWh', 'win %'
+        Valid metrics are the names in metrics.METRICS; anything else raises ValueError
 
-        Event: button, on click
+        Event: dropdown, on change
         """
-        # TODO: validate new metric
-        self.metric = new_metric
+        self.metric = metrics.validate(new_metric)
+
+
+def _dump_intervals(intervals):
+    return [[start.isoformat(), end.isoformat()] for start, end in intervals]
+
+
+def _load_intervals(dumped):
+    return IntervalSet((_to_date(start), _to_date(end)) for start, end in dumped)
+
+
+def _iso(value):
+    return value if isinstance(value, str) else value.isoformat()
+
+
+def _to_date(value):
+    # state values are ISO strings; datetimes from older states are cut to their date
+    return datetime.fromisoformat(value).date()
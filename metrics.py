@@ -0,0 +1,200 @@
+import math
+
+import polars as pl
+
+from datetime import timedelta
+
+from cube import MEASURES
+
+
+TRADING_DAYS = 252 # ratios are annualized over this many trading days
+
+# every metric the leaderboard can show and rank by -> whether higher ranks first
+METRICS = {
+    "PnL": True,
+    "per MWh": True,
+    "win %": True,
+    "Sharpe": True,
+    "Sortino": True,
+    "max drawdown": False,
+    "drawdown days": False,
+    "profit factor": True,
+    "30d PnL": True,
+    "90d PnL": True,
+}
+ROLLING = {"30d PnL": 30, "90d PnL": 90} # trailing windows, in calendar days
+RISK = ["Sharpe", "Sortino", "max drawdown", "drawdown days", "profit factor", *ROLLING] # from the daily series
+
+
+def validate(name):
+    """
+    Returns the metric name if it is in the registry, raises ValueError otherwise
+    """
+    if name not in METRICS:
+        raise ValueError(f"unknown metric {name!r}; valid metrics are {', '.join(METRICS)}")
+    return name
+
+
+def descending(name):
+    """
+    Whether the leaderboard sorts on the metric in descending order
+    """
+    return METRICS[validate(name)]
+
+
+def from_days(name):
+    """
+    Whether the metric is computed from the daily series (see risk) rather than from
+    the totals of the measures
+    """
+    return validate(name) in RISK
+
+
+def totals(frame, keys):
+    """
+    PnL, per MWh and win % per group, from per (policy, node) totals of the measures
+    """
+    return frame.group_by(keys).agg(pl.col(MEASURES).sum())\
+        .with_columns(
+            (pl.col("profit_total")/pl.col("mwh_total")).alias("per MWh"),
+            (pl.col("win_count_long")+pl.col("win_count_short")).alias("win_count"),
+        )\
+        .with_columns(
+            (100*pl.col("win_count")/pl.col("mwh_total")).alias("win %")
+        )\
+        .select(*keys, pl.col("profit_total").alias("PnL"), "per MWh", "win %")
+
+
+def risk(days, keys):
+    """
+    Sharpe, Sortino, max drawdown, drawdown days, profit factor and trailing PnL per
+    group, from daily rows (keys, "date", "profit_total")
+
+    One sort, then window expressions over the groups: the daily PnL is cumulated,
+    the drawdown is the distance to the running peak (starting from zero), and each
+    return to the peak starts a new drawdown episode whose length is counted in days
+    with data. Trailing PnL ends at the last day in focus.
+    """
+    if days.is_empty():
+        return pl.DataFrame(schema={**{key: days.schema[key] for key in keys}, **{name: pl.Float64 for name in RISK}})
+
+    end = days["date"].max()
+    pnl = pl.col("pnl")
+    daily = days.group_by([*keys, "date"]).agg(pl.col("profit_total").sum().alias("pnl"))\
+        .sort([*keys, "date"])\
+        .with_columns(pnl.cum_sum().over(keys).alias("cumulative"))\
+        .with_columns((pl.col("cumulative").cum_max().over(keys).clip(lower_bound=0) - pl.col("cumulative")).alias("drawdown"))\
+        .with_columns((pl.col("drawdown") == 0).cum_sum().over(keys).alias("episode"))\
+        .with_columns((pl.col("drawdown") > 0).sum().over([*keys, "episode"]).alias("underwater"))
+
+    downside = (pnl.clip(upper_bound=0) ** 2).mean().sqrt()
+    gains = pnl.filter(pnl > 0).sum()
+    losses = -pnl.filter(pnl < 0).sum()
+    annualize = math.sqrt(TRADING_DAYS)
+    return daily.group_by(keys).agg(
+        _ratio(pnl.mean() * annualize, pnl.std()).alias("Sharpe"),
+        _ratio(pnl.mean() * annualize, downside).alias("Sortino"),
+        pl.col("drawdown").max().alias("max drawdown"),
+        pl.col("underwater").max().cast(pl.Float64).alias("drawdown days"),
+        _ratio(gains, losses).alias("profit factor"),
+        *(
+            pnl.filter(pl.col("date") > end - timedelta(days=length)).sum().alias(name)
+            for name, length in ROLLING.items()
+        ),
+    )
+
+
+def cumulative(days, keys):
+    """
+    Every registry metric per group as of each day it has data, over all its days up
+    to that one (an expanding window), from daily rows (keys, "date", measures)
+
+    One sort, then cumulative window expressions over the groups: running sums give
+    the totals, the mean and variance of the daily PnL (for Sharpe and Sortino), the
+    gains and losses; running maxima give the drawdowns; trailing PnL is a rolling
+    sum over calendar days.
+    """
+    pnl = pl.col("pnl")
+    count = pl.col("count")
+    mean = pl.col("PnL") / count
+    annualize = math.sqrt(TRADING_DAYS)
+
+    daily = days.group_by([*keys, "date"]).agg(
+            pl.col("profit_total").sum().alias("pnl"),
+            pl.col("mwh_total").sum().alias("mwh"),
+            (pl.col("win_count_long") + pl.col("win_count_short")).sum().alias("wins"),
+        )\
+        .sort([*keys, "date"])\
+        .with_columns(
+            pnl.cum_sum().over(keys).alias("PnL"),
+            pl.int_range(1, pl.len() + 1).over(keys).alias("count"),
+            (pnl ** 2).cum_sum().over(keys).alias("squares"),
+            (pnl.clip(upper_bound=0) ** 2).cum_sum().over(keys).alias("downside"),
+            pnl.clip(lower_bound=0).cum_sum().over(keys).alias("gains"),
+            (-pnl.clip(upper_bound=0)).cum_sum().over(keys).alias("losses"),
+            pl.col(["mwh", "wins"]).cum_sum().over(keys),
+            *(
+                pnl.rolling_sum(window_size=f"{length}d", by="date", warn_if_unsorted=False).over(keys).alias(name)
+                for name, length in ROLLING.items()
+            ),
+        )\
+        .with_columns((pl.col("PnL").cum_max().over(keys).clip(lower_bound=0) - pl.col("PnL")).alias("drawdown"))\
+        .with_columns((pl.col("drawdown") == 0).cum_sum().over(keys).alias("episode"))\
+        .with_columns((pl.col("drawdown") > 0).cum_sum().over([*keys, "episode"]).alias("underwater"))
+
+    variance = (pl.col("squares") - count * mean ** 2) / (count - 1)
+    return daily.select(
+        *keys,
+        "date",
+        "PnL",
+        (pl.col("PnL") / pl.col("mwh")).alias("per MWh"),
+        (100 * pl.col("wins") / pl.col("mwh")).alias("win %"),
+        _ratio(mean * annualize, pl.when(count > 1).then(variance.clip(lower_bound=0).sqrt())).alias("Sharpe"),
+        _ratio(mean * annualize, (pl.col("downside") / count).sqrt()).alias("Sortino"),
+        pl.col("drawdown").cum_max().over(keys).alias("max drawdown"),
+        pl.col("underwater").cum_max().over(keys).cast(pl.Float64).alias("drawdown days"),
+        _ratio(pl.col("gains"), pl.col("losses")).alias("profit factor"),
+        *ROLLING,
+    )
+
+
+def replay(days, keys, metric):
+    """
+    The leaderboard of every day: each group's value of the metric over its history
+    up to that day, and its rank among the groups on that day (1 is the top)
+
+    The metric comes from one cumulative pass (see cumulative) and is carried forward
+    over the days a group has no data; ranks are one vectorized rank per day of the
+    (date, group) grid, rather than one summary per day.
+    """
+    if days.is_empty():
+        return pl.DataFrame(schema={**{key: days.schema[key] for key in keys}, "date": pl.Date, metric: pl.Float64, "rank": pl.UInt32})
+
+    values = cumulative(days, keys).select(*keys, "date", validate(metric))
+    grid = values.select(keys).unique().join(values.select("date").unique(), how="cross")
+    return grid.join(values, on=[*keys, "date"], how="left")\
+        .sort([*keys, "date"])\
+        .with_columns(pl.col(metric).fill_nan(None).forward_fill().over(keys))\
+        .with_columns(pl.col(metric).rank("min", descending=descending(metric)).over("date").alias("rank"))
+
+
+def table(node_totals, node_days, keys):
+    """
+    Every registry metric per group, in registry order; without daily rows
+    (node_days None) the risk metrics are null
+    """
+    board = totals(node_totals, keys)
+    if node_days is None:
+        board = board.with_columns(pl.lit(None, dtype=pl.Float64).alias(name) for name in RISK)
+    else:
+        board = board.join(risk(node_days, keys), on=keys, how="left")
+    return board.select(*keys, *METRICS)
+
+
+def _ratio(numerator, denominator):
+    # over a zero denominator (e.g. no losing day) the ratio is infinite, so the best
+    # groups rank first; only 0/0 and an undefined denominator give null
+    return pl.when(denominator > 0).then(numerator / denominator)\
+        .when((denominator == 0) & (numerator > 0)).then(float("inf"))\
+        .when((denominator == 0) & (numerator < 0)).then(float("-inf"))\
+        .otherwise(None)
@@ -0,0 +1,56 @@
+import zlib
+
+
+# colors of the known policy families, whatever market prefix their names carry
+# (e.g. "PJMvirts Captain Hindsight")
+FAMILIES = {
+    "Captain Hindsight": "#54C158",  # Green
+    "Pricetaker Short": "#FFA800",   # Orange
+    "Pricetaker Long": "#25A5FF",    # Blue
+}
+# the other policies take one of these, chosen from a hash of their name
+PALETTE = [
+    "#8E6CDF", "#E4572E", "#17BECF", "#D62F9C", "#BCBD22", "#8C564B",
+    "#2CA58D", "#F28E2B", "#4E79A7", "#B07AA1", "#9C755F", "#59A14F",
+]
+DEFAULT_COLOR = "#A0A0A0"
+
+
+def policy_colors(policies):
+    """
+    A color per policy, for any set of policies
+
+    Known families keep their colors; every other policy starts from the palette slot
+    its name hashes to and moves on to the next free one, so colors are distinct (up
+    to the size of the palette) and a policy keeps its color across page loads and
+    mostly across datasets.
+    """
+    colors = {}
+    for policy in sorted(policies):
+        family = next((color for name, color in FAMILIES.items() if policy.endswith(name)), None)
+        if family is not None:
+            colors[policy] = family
+
+    used = set(colors.values())
+    for policy in sorted(policies):
+        if policy in colors:
+            continue
+        slot = zlib.crc32(policy.encode()) % len(PALETTE)
+        free = [PALETTE[(slot + step) % len(PALETTE)] for step in range(len(PALETTE))]
+        colors[policy] = next((color for color in free if color not in used), free[0])
+        used.add(colors[policy])
+    return colors
+
+
+def table_styles(colors):
+    """
+    DataTable style_data_conditional rules painting each policy's rows in its color
+    """
+    return [
+        {
+            "if": {"filter_query": '{policy} = "%s"' % policy.replace('"', '\\"')},
+            "backgroundColor": color,
+            "color": "white",
+        }
+        for policy, color in colors.items()
+    ]
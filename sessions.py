@@ -0,0 +1,138 @@
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from collections import OrderedDict
+
+import data
+from logic import Leaderboard
+
+
+class MemoryBackend():
+    """
+    Bounded LRU of session states with a time-to-live, local to one process
+    """
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._states = OrderedDict()  # session id -> (last touched, state)
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._states.get(session_id)
+            if entry is None:
+                return None
+            touched, state = entry
+            if time.monotonic() - touched > self.ttl:
+                del self._states[session_id]
+                return None
+            self._states.move_to_end(session_id)
+            return state
+
+    def set(self, session_id, state):
+        with self._lock:
+            self._states[session_id] = (time.monotonic(), state)
+            self._states.move_to_end(session_id)
+            while len(self._states) > self.maxsize:
+                self._states.popitem(last=False)
+
+
+class SQLiteBackend():
+    """
+    Session states in a SQLite file, so several worker processes see the same sessions
+    """
+    def __init__(self, path, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions"
+                " (id TEXT PRIMARY KEY, state TEXT NOT NULL, touched REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, session_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT state FROM sessions WHERE id = ? AND touched > ?",
+                (session_id, time.time() - self.ttl),
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def set(self, session_id, state):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, state, touched) VALUES (?, ?, ?)",
+                (session_id, json.dumps(state), now),
+            )
+            conn.execute("DELETE FROM sessions WHERE touched <= ?", (now - self.ttl,))
+
+
+class SessionStore():
+    """
+    Maps a session id to that session's Leaderboard
+
+    Only the Leaderboard parameters are stored; the data itself stays in the shared
+    read-only dataset, so a session costs a few hundred bytes.
+    """
+    def __init__(self, backend=None, factory=Leaderboard):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.factory = factory # builds the leaderboard of a new session
+
+    def new(self, source=data.DEFAULT_SOURCE):
+        return self.factory(source)
+
+    def load(self, session_id):
+        state = self.backend.get(session_id) if session_id else None
+        if state is None:
+            return self.new()
+        return Leaderboard.from_state(state)
+
+    def save(self, session_id, board):
+        if session_id:
+            self.backend.set(session_id, board.get_state())
+
+    def claim(self, session_id, name, seq):
+        """
+        Records request number `seq` as the latest of its kind for the session;
+        returns False if a newer one was already claimed
+        """
+        if not session_id:
+            return True
+        latest = self.backend.get(f"{session_id}/{name}")
+        if latest is not None and latest > seq:
+            return False
+        self.backend.set(f"{session_id}/{name}", seq)
+        return True
+
+    def is_latest(self, session_id, name, seq):
+        """
+        Whether no newer request of the same kind has been claimed since `seq`
+        """
+        if not session_id:
+            return True
+        latest = self.backend.get(f"{session_id}/{name}")
+        return latest is None or latest <= seq
+
+
+def from_env():
+    """
+    Builds the store configured by LEADERBOARD_SESSIONS: unset for in-process memory,
+    or the path of a SQLite file shared by all workers
+
+    LEADERBOARD_LAZY=1 makes new sessions query lazy scans of the source
+    """
+    ttl = float(os.environ.get("LEADERBOARD_SESSION_TTL", 3600))
+    path = os.environ.get("LEADERBOARD_SESSIONS")
+    factory = functools.partial(Leaderboard, lazy=os.environ.get("LEADERBOARD_LAZY") == "1")
+    if path:
+        return SessionStore(SQLiteBackend(path, ttl=ttl), factory)
+    return SessionStore(MemoryBackend(ttl=ttl), factory)
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def repo(monkeypatch):
+    """
+    Runs the test from the repository root, where the example dataset lives
+    """
+    monkeypatch.chdir(ROOT)
+    return ROOT
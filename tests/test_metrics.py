@@ -0,0 +1,41 @@
+from datetime import date, timedelta
+
+import polars as pl
+
+import logic
+import metrics
+
+
+def _days(pnl_by_policy):
+    rows = [
+        {"policy": policy, "date": date(2024, 1, 1) + timedelta(days=day), "profit_total": pnl}
+        for policy, pnls in pnl_by_policy.items()
+        for day, pnl in enumerate(pnls)
+    ]
+    return pl.DataFrame(rows)
+
+
+def test_ratios_of_a_policy_that_never_loses_are_infinite():
+    risk = metrics.risk(_days({"steady": [5.0, 3.0, 4.0], "mixed": [5.0, -2.0, 4.0], "flat": [0.0, 0.0, 0.0]}), ["policy"])
+    by_policy = {row["policy"]: row for row in risk.iter_rows(named=True)}
+
+    assert by_policy["steady"]["profit factor"] == float("inf")
+    assert by_policy["steady"]["Sortino"] == float("inf")
+    assert by_policy["mixed"]["profit factor"] == 4.5
+    # nothing won, nothing lost: undefined
+    assert by_policy["flat"]["profit factor"] is None
+
+
+def test_policy_that_never_loses_ranks_first(repo):
+    board = logic.Leaderboard()
+    board.set_metric("profit factor")
+
+    ranked = board.summarize()
+    assert ranked["policy"][0] == "PJMvirts Captain Hindsight"
+    assert ranked["profit factor"][0] == float("inf")
+
+    # node by node too: the nodes of Captain Hindsight never lose, so they lead
+    board.group()
+    nodes = board.summarize()
+    assert nodes["policy"][:4].to_list() == ["PJMvirts Captain Hindsight"] * 4
+    assert nodes["profit factor"][:4].to_list() == [float("inf")] * 4
@@ -0,0 +1,55 @@
+import base64
+
+import numpy as np
+import polars as pl
+
+
+def typed_array(values, dtype):
+    """
+    A numpy array in plotly's typed array form: {"dtype": "f8", "bdata": <base64>}
+
+    The raw little-endian bytes are about a third of the size of a JSON list of
+    floats, and the browser wraps them in a typed array without parsing each number.
+    """
+    array = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder("<"))
+    return {"dtype": array.dtype.str[1:], "bdata": base64.b64encode(array.tobytes()).decode("ascii")}
+
+
+def series_chunk(daily, columns, name="policy"):
+    """
+    One entry per value of `name` of a frame sorted by (name, date): the dates as days
+    since 1970-01-01 ("i4") and each of the given columns ("f8")
+    """
+    if daily.is_empty():
+        return []
+
+    lengths = daily.group_by(name, maintain_order=True).agg(pl.len())
+    days = daily["date"].cast(pl.Int32).to_numpy()
+    values = {column: daily[column].cast(pl.Float64).to_numpy() for column in columns}
+
+    chunk = []
+    offset = 0
+    for label, length in lengths.iter_rows():
+        entry = {"name": label, "x": typed_array(days[offset:offset + length], "i4")}
+        for column in columns:
+            entry[column] = typed_array(values[column][offset:offset + length], "f8")
+        chunk.append(entry)
+        offset += length
+    return chunk
+
+
+def table_columns(frame):
+    """
+    A frame column by column for the metric table: numbers as typed arrays, anything
+    else as a list; the browser rebuilds the rows (see assets/leaderboard.js)
+    """
+    if frame is None:
+        return {"columns": [], "data": {}}
+
+    data = {}
+    for name, dtype in frame.schema.items():
+        if dtype.is_numeric():
+            data[name] = typed_array(frame[name].cast(pl.Float64).to_numpy(), "f8")
+        else:
+            data[name] = frame[name].cast(pl.Utf8).to_list()
+    return {"columns": frame.columns, "data": data}
@@ -0,0 +1,11 @@
+"""
+WSGI entry point for production serving: gunicorn -c gunicorn.conf.py wsgi:server
+"""
+from app import app
+
+
+# No polars query may run here: with preload_app the master imports this module,
+# and polars' thread pool does not survive the fork. Each worker loads the dataset
+# after forking (see post_fork in gunicorn.conf.py); the Arrow IPC sidecar is
+# memory-mapped, so its pages are still shared through the page cache.
+server = app.server